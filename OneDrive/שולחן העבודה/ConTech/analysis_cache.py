@@ -0,0 +1,75 @@
+import hashlib
+import json
+import os
+from typing import Dict, Optional
+
+import numpy as np
+
+CACHE_DIR = os.environ.get("CONTECH_CACHE_DIR", ".contech_cache")
+
+
+def file_hash(path: str) -> str:
+    """חתימת תוכן של קובץ (sha256) - משמשת כמפתח מטמון"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(*parts) -> str:
+    return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def _path(key: str, ext: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.{ext}")
+
+
+def save_arrays(key: str, **arrays) -> str:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _path(key, "npz")
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+def load_arrays(key: str) -> Optional[Dict[str, np.ndarray]]:
+    path = _path(key, "npz")
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return {k: data[k] for k in data.files}
+    except Exception:
+        return None
+
+
+def save_json(key: str, obj) -> str:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _path(key, "json")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    return path
+
+
+def load_json(key: str):
+    path = _path(key, "json")
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return None
+
+
+def pack_mask(mask: np.ndarray) -> np.ndarray:
+    return np.packbits(mask > 0)
+
+
+def unpack_mask(packed: np.ndarray, shape) -> np.ndarray:
+    h, w = int(shape[0]), int(shape[1])
+    return (np.unpackbits(packed, count=h * w).reshape(h, w) * 255).astype(np.uint8)
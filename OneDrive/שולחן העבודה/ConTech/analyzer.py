@@ -1,18 +1,94 @@
 import cv2
 import numpy as np
 import fitz  # PyMuPDF
-from typing import Tuple, Dict, Optional
+from typing import Tuple, Dict, Optional, List
 import pandas as pd
+import hashlib
+import json
 import re
 import os
 
+TILE_SIZE = 256
+TILE_HALO = 32
+# עובי קיר מקסימלי (בפיקסלים) בהיסטוגרמת העובי - עובי גדול יותר נספר בתא האחרון
+MAX_THICKNESS_PX = 127
+# פחות תווים מזה בשכבת הטקסט - הגיליון נחשב סרוק ועובר OCR (ocr.py)
+MIN_TEXT_CHARS = 20
+
+# פרופילי ניתוח - פשרה בין מהירות לדיוק.
+# ספי הרכיבים (שטח, עובי קו, גודל אות) וגרעין הסגירה מותאמים לרזולוציה של כל פרופיל
+ANALYSIS_PROFILES = {
+    "fast": {"dpi": 100, "max_dim": 1200, "median_blur": 3, "margin_percent": 0.10,
+             "open_kernel": 3, "min_component_area": 40, "min_stroke_px": 3, "max_glyph_px": 24,
+             "close_kernel": 3},
+    "balanced": {"dpi": 200, "max_dim": 2000, "median_blur": 5, "margin_percent": 0.10,
+                 "open_kernel": 3, "min_component_area": 100, "min_stroke_px": 4, "max_glyph_px": 40,
+                 "close_kernel": 5},
+    "precise": {"dpi": 300, "max_dim": 3200, "median_blur": 5, "margin_percent": 0.10,
+                "open_kernel": 3, "min_component_area": 250, "min_stroke_px": 6, "max_glyph_px": 64,
+                "close_kernel": 7},
+}
+# אות/סימון: תיבה קטנה ולא מוארכת
+GLYPH_MAX_ASPECT = 4.0
+# קיר ארוך פי כמה מהעובי שלו; כתם קצר ועבה (מילה אחרי ה-median blur) אינו קיר.
+# האורך נמדד כשטח / עובי² (אורך קו המרכז ביחידות עובי) ולא לפי התיבה - כך גם פינת L או T ליד פתח נחשבת.
+# העובי הוא המקסימלי ברכיב, ובצומת L/T הוא עד פי 1.4 מעובי הקיר - לכן הסף נמוך מ-5
+WALL_MIN_ELONGATION = 4.0
+# אות או מילה ממלאות חלק מהתיבה; קטע קיר קצר בין פתחים או עמוד - כמעט את כולה,
+# לכן כללי האות והכתם חלים רק מתחת לאחוז המילוי הזה
+TEXT_MAX_FILL = 0.85
+# פס ברוחב קו אחד שרובו ריק - שורת טקסט; קיר ישר ממלא כמעט את כל התיבה שלו
+TEXT_RUN_MAX_FILL = 0.8
+DEFAULT_PROFILE = "balanced"
+# פרמטרים שלמים והערך המינימלי של כל אחד; גרעיני ה-median חייבים להיות אי-זוגיים (דרישה של cv2)
+INT_PARAM_MIN = {"dpi": 1, "max_dim": 1, "median_blur": 1, "open_kernel": 1, "close_kernel": 1,
+                 "min_component_area": 0, "min_stroke_px": 0, "max_glyph_px": 0}
+ODD_PARAMS = ("median_blur",)
+
+
+def validate_params(params: Dict) -> None:
+    """בדיקת ערכי הפרמטרים מראש, כדי שערך שגוי ייכשל כאן עם שם הפרמטר ולא בתוך cv2"""
+    for name, minimum in INT_PARAM_MIN.items():
+        value = params[name]
+        if isinstance(value, bool) or not isinstance(value, (int, np.integer)):
+            raise ValueError(f"{name} חייב להיות מספר שלם (התקבל {value!r})")
+        if value < minimum:
+            raise ValueError(f"{name} חייב להיות לפחות {minimum} (התקבל {value})")
+        if name in ODD_PARAMS and value % 2 == 0:
+            raise ValueError(f"{name} חייב להיות אי-זוגי (התקבל {value})")
+    margin = params["margin_percent"]
+    if isinstance(margin, bool) or not isinstance(margin, (int, float)) or not 0 <= margin < 0.5:
+        raise ValueError(f"margin_percent חייב להיות בין 0 ל-0.5 (התקבל {margin!r})")
+
+
 class FloorPlanAnalyzer:
     """מחלקה לניתוח תוכניות בנייה - אופטימיזציה למהירות ודיוק"""
     
-    def __init__(self):
-        pass
+    def __init__(self, profile: str = DEFAULT_PROFILE, **params):
+        """
+        profile: fast / balanced / precise
+        params: דריסת פרמטרים של הפרופיל (dpi, max_dim, median_blur, margin_percent, open_kernel,
+                min_component_area, min_stroke_px, max_glyph_px, close_kernel) - הפרופיל יסומן custom
+        """
+        if profile not in ANALYSIS_PROFILES:
+            raise ValueError(f"פרופיל ניתוח לא מוכר: {profile}")
+        unknown = set(params) - set(ANALYSIS_PROFILES[profile])
+        if unknown:
+            raise ValueError(f"פרמטרי ניתוח לא מוכרים: {', '.join(sorted(unknown))}")
+        self.params = {**ANALYSIS_PROFILES[profile], **params}
+        validate_params(self.params)
+        self.profile = profile if self.params == ANALYSIS_PROFILES[profile] else "custom"
+
+    @property
+    def profile_key(self) -> str:
+        """ייצוג קנוני של הפרמטרים - חלק ממפתח המטמון"""
+        return json.dumps(self.params, sort_keys=True)
+
+    def profile_info(self) -> Dict:
+        return {"name": self.profile, "params": dict(self.params)}
     
-    def pdf_to_image(self, pdf_path: str, dpi: int = 200) -> np.ndarray:
+    def pdf_to_image(self, pdf_path: str, dpi: Optional[int] = None) -> np.ndarray:
+        dpi = dpi or self.params["dpi"]
         doc = fitz.open(pdf_path)
         page = doc[0]
         mat = fitz.Matrix(dpi / 72, dpi / 72)
@@ -54,47 +130,183 @@ class FloorPlanAnalyzer:
                 break
         return skel
 
+    def iter_tiles(self, shape: Tuple[int, ...], tile_size: int = TILE_SIZE):
+        h, w = shape[:2]
+        for y0 in range(0, h, tile_size):
+            for x0 in range(0, w, tile_size):
+                yield y0, min(y0 + tile_size, h), x0, min(x0 + tile_size, w)
+
+    def _padded_tile(self, mask: np.ndarray, tile: Tuple[int, int, int, int], halo: int) -> np.ndarray:
+        y0, y1, x0, x1 = tile
+        h, w = mask.shape[:2]
+        return mask[max(0, y0 - halo):min(h, y1 + halo), max(0, x0 - halo):min(w, x1 + halo)]
+
+    def tile_has_content(self, mask: np.ndarray, tile: Tuple[int, int, int, int], halo: int = TILE_HALO) -> bool:
+        """האם יש באריח (כולל השוליים) פיקסל קיר - לאריח ריק יש אותה חתימה בכל גיליון באותו גודל"""
+        return cv2.countNonZero(self._padded_tile(mask, tile, halo)) > 0
+
+    def tile_hash(self, mask: np.ndarray, tile: Tuple[int, int, int, int], halo: int = TILE_HALO) -> str:
+        """חתימת תוכן של אריח כולל שוליים - אריח עם אותה חתימה ייתן אותו שלד"""
+        padded = self._padded_tile(mask, tile, halo)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(np.array(padded.shape + tile, dtype=np.int32).tobytes())
+        digest.update(np.ascontiguousarray(padded).tobytes())
+        return digest.hexdigest()
+
+    def skeletonize_tile(self, mask: np.ndarray, tile: Tuple[int, int, int, int],
+                         halo: int = TILE_HALO) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        שלד ועובי קיר של אריח אחד באותו מעבר:
+        distance transform מחושב פעם אחת על האריח (עם השוליים) ונדגם בפיקסלי השלד
+        מחזירה: (שלד, מפת עובי בפיקסלים - ערך רק בפיקסלי השלד)
+        """
+        y0, y1, x0, x1 = tile
+        h, w = mask.shape[:2]
+        py0, px0 = max(0, y0 - halo), max(0, x0 - halo)
+        padded = mask[py0:min(h, y1 + halo), px0:min(w, x1 + halo)]
+        if cv2.countNonZero(padded) == 0:
+            empty = np.zeros((y1 - y0, x1 - x0), np.uint8)
+            return empty, empty.copy()
+        skel = self.skeletonize(padded)[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+        dist = cv2.distanceTransform(padded, cv2.DIST_L2, 5)[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+        thickness = np.zeros(skel.shape, np.uint8)
+        on = skel > 0
+        # מרחק ממרכז הקיר לרקע הוא (t + 1) / 2 עבור קיר בעובי t פיקסלים
+        thickness[on] = np.clip(np.rint(2 * dist[on] - 1), 1, 255).astype(np.uint8)
+        return skel, thickness
+
+    def thickness_histogram(self, thickness: np.ndarray) -> np.ndarray:
+        """מספר פיקסלי שלד לכל עובי (בפיקסלים) - האינדקס הוא העובי"""
+        values = np.minimum(thickness[thickness > 0], MAX_THICKNESS_PX)
+        return np.bincount(values, minlength=MAX_THICKNESS_PX + 1).astype(np.int64)
+
+    def skeletonize_tiles(self, mask: np.ndarray, previous: Optional[Dict] = None,
+                          tile_size: int = TILE_SIZE, hashes: Optional[List[str]] = None) -> Tuple[np.ndarray, Dict]:
+        """
+        שלד לפי אריחים - אריח שהחתימה שלו זהה לגרסה הקודמת לא מחושב מחדש
+        previous: {"skeleton", "thickness", "tile_hashes", "tile_counts", "tile_thickness_hist", "tile_size"}
+                  מגרסה קודמת (אופציונלי)
+        hashes: חתימות האריחים אם כבר חושבו (לפי סדר iter_tiles)
+        מחזירה: (שלד, {"thickness", "thickness_hist", "tile_hashes", "tile_counts",
+                       "tile_thickness_hist", "changed_tiles", "tile_size"})
+        """
+        skeleton = np.zeros(mask.shape[:2], np.uint8)
+        thickness = np.zeros(mask.shape[:2], np.uint8)
+        reusable = (previous is not None
+                    and previous.get("tile_size") == tile_size
+                    and previous.get("thickness") is not None
+                    and previous["skeleton"].shape == skeleton.shape)
+        known_hashes = hashes
+        hashes = []
+        counts: List[int] = []
+        hists: List[np.ndarray] = []
+        changed: List[int] = []
+        for idx, tile in enumerate(self.iter_tiles(mask.shape, tile_size)):
+            y0, y1, x0, x1 = tile
+            tile_id = known_hashes[idx] if known_hashes is not None else self.tile_hash(mask, tile)
+            if reusable and idx < len(previous["tile_hashes"]) and previous["tile_hashes"][idx] == tile_id:
+                skeleton[y0:y1, x0:x1] = previous["skeleton"][y0:y1, x0:x1]
+                thickness[y0:y1, x0:x1] = previous["thickness"][y0:y1, x0:x1]
+                counts.append(int(previous["tile_counts"][idx]))
+                hists.append(previous["tile_thickness_hist"][idx])
+            else:
+                skeleton[y0:y1, x0:x1], thickness[y0:y1, x0:x1] = self.skeletonize_tile(mask, tile)
+                counts.append(cv2.countNonZero(skeleton[y0:y1, x0:x1]))
+                hists.append(self.thickness_histogram(thickness[y0:y1, x0:x1]))
+                changed.append(idx)
+            hashes.append(tile_id)
+        tile_hists = np.array(hists, dtype=np.int64).reshape(len(hists), MAX_THICKNESS_PX + 1)
+        return skeleton, {"thickness": thickness, "thickness_hist": tile_hists.sum(axis=0),
+                          "tile_hashes": hashes, "tile_counts": np.array(counts, dtype=np.int64),
+                          "tile_thickness_hist": tile_hists, "changed_tiles": changed, "tile_size": tile_size}
+
+    def component_stroke_widths(self, binary: np.ndarray, fg: np.ndarray, fg_labels: np.ndarray,
+                                num_labels: int) -> np.ndarray:
+        """
+        עובי הקו המקסימלי בכל רכיב (2 * מרחק מהרקע - 1, כמו בהיסטוגרמת העובי)
+        fg: אינדקסים שטוחים של פיקסלי החזית; fg_labels: התווית של כל אחד מהם
+        """
+        dist = cv2.distanceTransform(binary, cv2.DIST_L2, 5)
+        max_dist = np.zeros(num_labels, np.float32)
+        np.maximum.at(max_dist, fg_labels, dist.reshape(-1)[fg])
+        return np.maximum(2 * max_dist - 1, 0)
+
+    def classify_components(self, stats: np.ndarray, stroke: np.ndarray) -> np.ndarray:
+        """
+        קירות מול טקסט, קווי מידה וקווקוו - לפי שטח, יחס צלעות התיבה, אחוז מילוי ועובי קו
+        מחזירה: מערך bool באורך מספר הרכיבים - True לרכיב שנשמר
+        """
+        p = self.params
+        area = stats[:, cv2.CC_STAT_AREA].astype(np.float32)
+        w = stats[:, cv2.CC_STAT_WIDTH].astype(np.float32)
+        h = stats[:, cv2.CC_STAT_HEIGHT].astype(np.float32)
+        long_side, short_side = np.maximum(w, h), np.maximum(np.minimum(w, h), 1)
+        fill = area / np.maximum(w * h, 1)
+        thin = stroke < p["min_stroke_px"]
+        text_like = fill < TEXT_MAX_FILL
+        glyph = text_like & (long_side <= p["max_glyph_px"]) & (long_side / short_side <= GLYPH_MAX_ASPECT)
+        elongation = area / np.maximum(stroke, 1) ** 2
+        blob = text_like & (elongation < WALL_MIN_ELONGATION)
+        text_run = (short_side <= 2 * stroke) & (fill < TEXT_RUN_MAX_FILL)
+        return (area >= p["min_component_area"]) & ~thin & ~glyph & ~blob & ~text_run
+
     def preprocess_image(self, image: np.ndarray) -> np.ndarray:
+        p = self.params
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        filtered = cv2.medianBlur(gray, 5) 
+        filtered = cv2.medianBlur(gray, p["median_blur"]) if p["median_blur"] > 1 else gray
         _, binary = cv2.threshold(filtered, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
-        binary = self.remove_margins(binary, margin_percent=0.10)
+        binary = self.remove_margins(binary, margin_percent=p["margin_percent"])
         
-        kernel = np.ones((3, 3), np.uint8)
+        kernel = np.ones((p["open_kernel"], p["open_kernel"]), np.uint8)
         processed = cv2.morphologyEx(binary, cv2.MORPH_OPEN, kernel)
         
-        num_labels, labels, stats, centroids = cv2.connectedComponentsWithStats(processed, connectivity=8)
+        # סינון רכיבים במעבר אחד: סיווג כל הרכיבים וקטורית ואז טבלת חיפוש אחת לפי התווית
+        num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(processed, connectivity=8)
+        # רק פיקסלי החזית (בדרך כלל אחוזים בודדים מהגיליון)
+        fg = np.flatnonzero(processed)
+        fg_labels = labels.reshape(-1)[fg]
+        stroke = self.component_stroke_widths(processed, fg, fg_labels, num_labels)
+        lut = np.where(self.classify_components(stats, stroke), 255, 0).astype(np.uint8)
+        lut[0] = 0
         mask = np.zeros_like(processed)
-        for i in range(1, num_labels):
-            if stats[i, cv2.CC_STAT_AREA] >= 100:
-                mask[labels == i] = 255
+        mask.reshape(-1)[fg] = lut[fg_labels]
         
-        return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+        close = p["close_kernel"]
+        return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((close, close), np.uint8))
     
     def extract_metadata(self, pdf_path: str) -> Dict[str, Optional[str]]:
         doc = fitz.open(pdf_path)
         text = doc[0].get_text()
         doc.close()
-        metadata = {"plan_name": None, "scale": None, "raw_text": text[:500]}
+        text_source = "pdf"
+        if len(text.strip()) < MIN_TEXT_CHARS:
+            # גיליון סרוק בלי שכבת טקסט - OCR מקומי על טבלת הכותרת בלבד
+            from ocr import ocr_title_block
+            ocr_text = ocr_title_block(pdf_path)["text"]
+            if ocr_text:
+                text, text_source = ocr_text, "ocr"
+        metadata = {"plan_name": None, "scale": None, "raw_text": text[:500], "text_source": text_source}
         match = re.search(r"(?:תוכנית|שם\s*שרטוט|Project)[\s:]+([^\n\r]+)", text, re.IGNORECASE)
         metadata["plan_name"] = match.group(1).strip() if match else os.path.basename(pdf_path).replace(".pdf", "")
         match_s = re.search(r"(\d+)[\s:]*[:/][\s]*(\d+)", text)
         if match_s: metadata["scale"] = f"{match_s.group(1)}:{match_s.group(2)}"
         return metadata
     
-    def process_file(self, pdf_path: str) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray, Dict[str, Optional[str]]]:
+    def load_plan_image(self, pdf_path: str) -> np.ndarray:
         image = self.pdf_to_image(pdf_path)
         h, w = image.shape[:2]
-        max_dim = 2000
+        max_dim = self.params["max_dim"]
         if max(h, w) > max_dim:
             scale = max_dim / max(h, w)
-            image_proc = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
-        else:
-            image_proc = image
-            
+            return cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        return image
+
+    def process_file(self, pdf_path: str) -> Tuple[int, np.ndarray, np.ndarray, np.ndarray, Dict[str, Optional[str]]]:
+        image_proc = self.load_plan_image(pdf_path)
         thick_walls = self.preprocess_image(image_proc)
-        skeleton = self.skeletonize(thick_walls)
+        skeleton, _ = self.skeletonize_tiles(thick_walls)
         total_pixels = cv2.countNonZero(skeleton)
         metadata = self.extract_metadata(pdf_path)
+        metadata["analysis_profile"] = self.profile_info()
         
         return total_pixels, skeleton, thick_walls, image_proc, metadata
\ No newline at end of file
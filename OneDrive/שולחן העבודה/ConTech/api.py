@@ -0,0 +1,251 @@
+import asyncio
+import csv
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import FastAPI, File, HTTPException, Query, UploadFile
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+from analyzer import ANALYSIS_PROFILES, DEFAULT_PROFILE
+import db_metrics
+from boq_export import BOQ_COLUMNS, iter_boq_rows
+from database import (
+    init_database, get_all_plans, get_plan_by_id, get_project_forecast,
+    get_project_financial_status, create_job, update_job, get_job
+)
+
+# תהליכי ניתוח (CPU) לכל worker של uvicorn
+ANALYSIS_PROCESSES = int(os.environ.get("CONTECH_ANALYSIS_PROCESSES", max(1, (os.cpu_count() or 2) // 2)))
+UPLOAD_CHUNK_BYTES = 1 << 20
+
+_executor: Optional[ProcessPoolExecutor] = None
+_analyzers = {}
+
+
+def _run_analysis_job(job_id: str, pdf_path: str, filename: str, profile: str = DEFAULT_PROFILE) -> None:
+    """רץ בתהליך נפרד - ניתוח התוכנית ועדכון סטטוס העבודה במסד"""
+    from analyzer import FloorPlanAnalyzer
+    from brain import process_plan_metadata
+    from revisions import analyze_revision
+
+    try:
+        update_job(job_id, "running")
+        if profile not in _analyzers:
+            _analyzers[profile] = FloorPlanAnalyzer(profile)
+        pix, _, _, _, meta, revision = analyze_revision(_analyzers[profile], pdf_path, filename)
+        llm_metadata = {}
+        if meta.get("raw_text"):
+            try:
+                llm_metadata = process_plan_metadata(meta["raw_text"])
+            except Exception:
+                pass
+        update_job(job_id, "done", {
+            "filename": filename,
+            "raw_pixel_count": pix,
+            "metadata": meta,
+            "llm_suggestions": llm_metadata,
+            "revision": revision,
+        })
+    except Exception as e:
+        update_job(job_id, "failed", error=str(e))
+    finally:
+        os.unlink(pdf_path)
+
+
+def _fail_job(job_id: str, pdf_path: str, error: str) -> None:
+    """עבודה שלא רצה עד הסוף בתהליך הניתוח - מסומנת כנכשלה והקובץ הזמני נמחק"""
+    update_job(job_id, "failed", error=error)
+    if os.path.exists(pdf_path):
+        os.unlink(pdf_path)
+
+
+def _mark_crashed(job_id: str, pdf_path: str, future) -> None:
+    """
+    אם תהליך הניתוח עצמו קרס (ולא רק זרק חריגה) - העבודה מסומנת כנכשלה
+    רץ כ-callback על לולאת האירועים, אז הכתיבה למסד נשלחת ל-thread ולא חוסמת אותה
+    """
+    if not future.cancelled() and future.exception() is not None:
+        asyncio.get_running_loop().run_in_executor(None, _fail_job, job_id, pdf_path, str(future.exception()))
+
+
+def _new_executor() -> ProcessPoolExecutor:
+    # spawn ולא fork - כדי לא לשכפל חיבורי SQLite פתוחים לתהליכי הניתוח
+    return ProcessPoolExecutor(max_workers=ANALYSIS_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _submit_analysis(*args) -> asyncio.Future:
+    """
+    שליחת ניתוח למאגר התהליכים
+    תהליך שנהרג (למשל OOM) שובר את המאגר לצמיתות - בונים מאגר חדש ומנסים פעם אחת נוספת
+    """
+    global _executor
+    loop = asyncio.get_running_loop()
+    try:
+        return loop.run_in_executor(_executor, _run_analysis_job, *args)
+    except BrokenProcessPool:
+        broken, _executor = _executor, _new_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+        return loop.run_in_executor(_executor, _run_analysis_job, *args)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _executor
+    init_database()
+    _executor = _new_executor()
+    yield
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="ConTech API", lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=os.environ.get("CONTECH_CORS_ORIGINS", "*").split(","),
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/metrics")
+def metrics(format: str = Query("prometheus", pattern="^(prometheus|json)$")):
+    """מדדי שאילתות המסד של ה-worker הזה (CONTECH_DB_METRICS=1)"""
+    if format == "json":
+        return db_metrics.snapshot()
+    return PlainTextResponse(db_metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.post("/plans/upload", status_code=202)
+async def upload_plan(file: UploadFile = File(...), profile: str = DEFAULT_PROFILE):
+    """
+    מקבל PDF בהזרמה (לפי chunks), שומר לקובץ זמני ומחזיר מזהה עבודה לניתוח
+    profile: fast / balanced / precise
+    """
+    if not file.filename or not file.filename.lower().endswith(".pdf"):
+        raise HTTPException(status_code=400, detail="נדרש קובץ PDF")
+    if profile not in ANALYSIS_PROFILES:
+        raise HTTPException(status_code=400, detail=f"פרופיל ניתוח לא מוכר: {profile}")
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as tmp:
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            await run_in_threadpool(tmp.write, chunk)
+
+    job_id = uuid.uuid4().hex
+    await run_in_threadpool(create_job, job_id, file.filename)
+    try:
+        future = _submit_analysis(job_id, path, file.filename, profile)
+    except (BrokenProcessPool, RuntimeError) as e:
+        await run_in_threadpool(_fail_job, job_id, path, str(e))
+        raise HTTPException(status_code=503, detail="מנוע הניתוח אינו זמין כרגע")
+    future.add_done_callback(lambda f: _mark_crashed(job_id, path, f))
+    return {"job_id": job_id, "status": "queued", "profile": profile}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    job = get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="עבודה לא נמצאה")
+    return job
+
+
+@app.get("/plans")
+def list_plans():
+    return get_all_plans()
+
+
+def _plan_or_404(plan_id: int):
+    plan = get_plan_by_id(plan_id)
+    if not plan:
+        raise HTTPException(status_code=404, detail="תוכנית לא נמצאה")
+    return plan
+
+
+@app.get("/plans/{plan_id}")
+def plan_details(plan_id: int):
+    return _plan_or_404(plan_id)
+
+
+class ProgressReportIn(BaseModel):
+    meters_built: float = Field(ge=0)
+    note: str = ""
+    worker_name: Optional[str] = None
+
+
+@app.post("/plans/{plan_id}/reports", status_code=201)
+async def submit_report(plan_id: int, report: ProgressReportIn):
+    """דיווח התקדמות - נכתב בקבוצות דרך הכותב היחיד; התשובה נשלחת אחרי ה-COMMIT"""
+    from ingest import submit_progress_report
+
+    await run_in_threadpool(_plan_or_404, plan_id)
+    future = submit_progress_report(report.meters_built, report.note, plan_id=plan_id, worker_name=report.worker_name)
+    _, report_id, _ = await asyncio.wrap_future(future)
+    return {"id": report_id, "plan_id": plan_id}
+
+
+@app.get("/plans/{plan_id}/forecast")
+def plan_forecast(plan_id: int):
+    _plan_or_404(plan_id)
+    return get_project_forecast(plan_id)
+
+
+@app.get("/plans/{plan_id}/finance")
+def plan_finance(plan_id: int):
+    _plan_or_404(plan_id)
+    return get_project_financial_status(plan_id)
+
+
+def _boq_response(plan_ids: Optional[List[int]], detail: bool, fmt: str, filename: str):
+    def stream_csv():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=BOQ_COLUMNS)
+        writer.writeheader()
+        for row in iter_boq_rows(plan_ids, detail):
+            writer.writerow(row)
+            if buf.tell() > 64 * 1024:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    def stream_jsonl():
+        for row in iter_boq_rows(plan_ids, detail):
+            yield json.dumps(row, ensure_ascii=False) + "\n"
+
+    if fmt == "jsonl":
+        return StreamingResponse(stream_jsonl(), media_type="application/x-ndjson")
+    return StreamingResponse(stream_csv(), media_type="text/csv; charset=utf-8",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}.csv"'})
+
+
+@app.get("/plans/{plan_id}/boq")
+def plan_boq(plan_id: int, detail: bool = False, format: str = Query("csv", pattern="^(csv|jsonl)$")):
+    _plan_or_404(plan_id)
+    return _boq_response([plan_id], detail, format, f"boq_{plan_id}")
+
+
+@app.get("/boq")
+def portfolio_boq(detail: bool = False, format: str = Query("csv", pattern="^(csv|jsonl)$")):
+    return _boq_response(None, detail, format, "boq_portfolio")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run("api:app", host="0.0.0.0", port=int(os.environ.get("PORT", 8000)),
+                workers=int(os.environ.get("WEB_CONCURRENCY", 4)))
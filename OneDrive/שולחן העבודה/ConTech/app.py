@@ -1,38 +1,77 @@
+import time
+_RUN_START = time.perf_counter()
+
 import streamlit as st
-from PIL import Image
-import cv2
-import numpy as np
-import pandas as pd
-from analyzer import FloorPlanAnalyzer
 import tempfile
 import os
 import json
-from streamlit_drawable_canvas import st_canvas
 
-# ייבוא מתוקן למניעת קריסה
+# מודולים כבדים (cv2, pandas, PIL, המנתח, הקנבס) נטענים רק בענפים שמשתמשים בהם
 from database import (
-    init_database, save_plan, save_progress_report, 
-    get_progress_reports, get_plan_by_filename, get_plan_by_id, get_all_plans,
-    get_project_forecast, 
+    init_database, save_plan, 
+    get_progress_reports, get_progress_timeseries, get_progress_reports_page, get_plan_by_filename, get_plan_by_id, get_all_plans,
+    get_project_forecast, get_data_version,
     calculate_material_estimates, get_project_financial_status, reset_all_data
 )
-from brain import learn_from_confirmation, process_plan_metadata
+from brain import learn_from_confirmation, process_plan_metadata, suggest_scale
 from datetime import datetime
+import db_metrics
+
+CHART_MAX_POINTS = 60
+PROFILE_LABELS = {"fast": "תצוגה מקדימה מהירה", "balanced": "מאוזן", "precise": "מדויק (איטי)"}
+
+@st.cache_resource(show_spinner=False)
+def init_database_once():
+    """CREATE TABLE וכו' - פעם אחת לתהליך ולא בכל ריצה של הסקריפט"""
+    init_database()
+    return True
+
+@st.cache_resource(show_spinner=False)
+def get_analyzer(profile):
+    from analyzer import FloorPlanAnalyzer
+    return FloorPlanAnalyzer(profile)
+
+# שאילתות שמורות במטמון לפי מונה הגרסה של המסד - כל כתיבה (גם מתהליך אחר) פוסלת אותן
+@st.cache_data(show_spinner=False, max_entries=32)
+def cached_all_plans(version):
+    return get_all_plans()
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def cached_forecast(version, plan_id):
+    return get_project_forecast(plan_id)
+
+@st.cache_data(show_spinner=False, max_entries=128)
+def cached_financial_status(version, plan_id):
+    return get_project_financial_status(plan_id)
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def cached_boq_csv(version, plan_ids=None, detail=False):
+    from boq_export import export_boq_csv_bytes
+    return export_boq_csv_bytes(plan_ids, detail=detail)
 
-Image.MAX_IMAGE_PIXELS = None
-init_database()
+@st.cache_data(show_spinner=False, max_entries=128)
+def load_stats_df(version, plan_id, bucket):
+    import pandas as pd
+    series = get_progress_timeseries(plan_id, bucket=bucket, max_points=CHART_MAX_POINTS)
+    if series:
+        return pd.DataFrame(series).rename(columns={'bucket': 'תאריך', 'meters': 'מטרים שבוצעו'})
+    return pd.DataFrame()
 
-def load_stats_df():
-    reports = get_progress_reports()
+@st.cache_data(show_spinner=False, max_entries=128)
+def load_recent_reports_df(version, plan_id, limit=5):
+    import pandas as pd
+    reports, _ = get_progress_reports_page(plan_id, limit=limit)
     if reports:
-        df = pd.DataFrame(reports)
-        return df.rename(columns={
+        return pd.DataFrame(reports).rename(columns={
             'date': 'תאריך', 'plan_name': 'שם תוכנית',
             'meters_built': 'מטרים שבוצעו', 'note': 'הערה'
         })
     return pd.DataFrame()
 
 st.set_page_config(page_title="ConTech Pro", layout="wide", page_icon="🏗️")
+init_database_once()
+page_queries = db_metrics.start_tracking() if db_metrics.enabled() else None
+data_version = get_data_version()
 
 # --- CSS ---
 st.markdown("""
@@ -59,6 +98,7 @@ st.markdown("""
 if 'projects' not in st.session_state: st.session_state.projects = {}
 if 'wall_height' not in st.session_state: st.session_state.wall_height = 2.5
 if 'default_cost_per_meter' not in st.session_state: st.session_state.default_cost_per_meter = 0.0
+if 'analysis_profile' not in st.session_state: st.session_state.analysis_profile = "balanced"
 
 with st.sidebar:
     st.image("https://cdn-icons-png.flaticon.com/512/2942/2942823.png", width=50)
@@ -70,6 +110,8 @@ with st.sidebar:
     with st.expander("⚙️ הגדרות גלובליות", expanded=False):
         st.session_state.wall_height = st.number_input("גובה קירות (מ')", value=st.session_state.wall_height, step=0.1)
         st.session_state.default_cost_per_meter = st.number_input("עלות למטר (₪)", value=st.session_state.default_cost_per_meter, step=10.0)
+        st.session_state.analysis_profile = st.selectbox("פרופיל ניתוח", list(PROFILE_LABELS), format_func=PROFILE_LABELS.get,
+                                                         index=list(PROFILE_LABELS).index(st.session_state.analysis_profile))
     st.markdown("<br><br><br>", unsafe_allow_html=True)
     if st.button("🗑️ איפוס מערכת מלא", help="מוחק את כל הנתונים והפרויקטים"):
         if reset_all_data():
@@ -96,8 +138,9 @@ if mode == "🏢 מנהל פרויקט":
                         with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
                             tmp.write(f.getvalue())
                             path = tmp.name
-                        analyzer = FloorPlanAnalyzer()
-                        pix, skel, thick, orig, meta = analyzer.process_file(path)
+                        from revisions import analyze_revision
+                        analyzer = get_analyzer(st.session_state.analysis_profile)
+                        pix, skel, thick, orig, meta, revision = analyze_revision(analyzer, path, f.name)
                         if not meta.get("plan_name"): meta["plan_name"] = f.name.replace(".pdf", "").replace("-", " ").strip()
                         raw_text = meta.get("raw_text", "")
                         llm_metadata = {}
@@ -107,10 +150,13 @@ if mode == "🏢 מנהל פרויקט":
                                 if llm_metadata.get("plan_name"): meta["plan_name"] = llm_metadata["plan_name"]
                                 if llm_metadata.get("scale"): meta["scale"] = llm_metadata["scale"]
                             except: pass
+                        scale = suggest_scale(f.name, meta.get("plan_name"), revision.get("fingerprint"), thick.shape[1],
+                                              revision.get("content_aspect")) or 200.0
                         st.session_state.projects[f.name] = {
                             "skeleton": skel, "thick_walls": thick, "original": orig,
-                            "raw_pixels": pix, "scale": 200.0, "metadata": meta,
-                            "total_length": pix / 200.0, "llm_suggestions": llm_metadata
+                            "raw_pixels": pix, "scale": scale, "metadata": meta,
+                            "total_length": pix / scale, "llm_suggestions": llm_metadata,
+                            "revision": revision, "thickness_hist": revision.get("thickness_hist")
                         }
                         os.unlink(path)
 
@@ -135,37 +181,50 @@ if mode == "🏢 מנהל פרויקט":
                 with col_d2: budget_limit_val = st.number_input("תקציב (₪)", step=1000.0, key=f"bl_{selected}")
                 cost_per_meter_val = st.number_input("עלות למטר (₪)", value=st.session_state.default_cost_per_meter, key=f"cpm_{selected}")
                 st.markdown("#### כיול")
-                scale_val = st.slider("פיקסלים למטר", 10.0, 1000.0, float(proj["scale"]), key=f"sl_{selected}")
+                scale_val = st.slider("פיקסלים למטר", 10.0, 1000.0, float(min(max(proj["scale"], 10.0), 1000.0)), key=f"sl_{selected}")
                 proj["scale"] = scale_val
                 proj["total_length"] = proj["raw_pixels"] / scale_val
                 st.info(f"📏 אורך קירות: **{proj['total_length']:.2f} מטר**")
+                rev = proj.get("revision") or {}
+                if rev.get("parent_id"):
+                    caption = f"🔁 גרסה חדשה של {rev['parent_filename']} · עודכנו {len(rev['changed_tiles'])}/{rev['total_tiles']} אריחים"
+                    if rev.get("length_delta_m") is not None:
+                        caption += f" · שינוי באורך קירות: {rev['length_delta_m']:+.2f} מ'"
+                    elif rev.get("pixel_delta") is not None:
+                        caption += f" · שינוי באורך קירות: {rev['pixel_delta'] / scale_val:+.2f} מ'"
+                    st.caption(caption)
                 if st.button("💾 שמור נתונים", type="primary", use_container_width=True):
                     proj["metadata"]["plan_name"] = p_name
                     proj["metadata"]["scale"] = p_scale
                     metadata_json = json.dumps(proj["metadata"], ensure_ascii=False)
-                    materials = calculate_material_estimates(proj["total_length"], st.session_state.wall_height)
+                    materials = calculate_material_estimates(proj["total_length"], st.session_state.wall_height, proj.get("thickness_hist"), scale_val)
                     save_plan(selected, p_name, p_scale, scale_val, proj["raw_pixels"], metadata_json, target_date_str, budget_limit_val, cost_per_meter_val, json.dumps(materials, ensure_ascii=False))
                     st.success("נשמר!")
 
             with col_preview:
                 st.image(proj["skeleton"], caption="זיהוי קירות", use_container_width=True)
                 if proj["total_length"] > 0:
-                    mats = calculate_material_estimates(proj["total_length"], st.session_state.wall_height)
+                    from estimates import BLOCK_TYPES
+                    mats = calculate_material_estimates(proj["total_length"], st.session_state.wall_height,
+                                                        proj.get("thickness_hist"), proj["scale"])
                     st.markdown("###### הערכה מהירה")
                     c1, c2, c3 = st.columns(3)
                     c1.markdown(f"<div class='mat-card'><div class='mat-val'>{mats['block_count']:,}</div><div class='mat-lbl'>בלוקים</div></div>", unsafe_allow_html=True)
                     c2.markdown(f"<div class='mat-card'><div class='mat-val'>{mats['cement_cubic_meters']:.1f}</div><div class='mat-lbl'>מ\"ק מלט</div></div>", unsafe_allow_html=True)
                     c3.markdown(f"<div class='mat-card'><div class='mat-val'>{mats['wall_area_sqm']:.0f}</div><div class='mat-lbl'>מ\"ר קיר</div></div>", unsafe_allow_html=True)
+                    if mats.get("by_block_type"):
+                        by_type = mats["by_block_type"]
+                        st.caption(" · ".join(f"{BLOCK_TYPES[bt]['thickness_cm']} ס\"מ: {est['length_m']:.1f} מ' ({est['block_count']:,} בלוקים)" for bt, est in by_type.items() if est["length_m"] > 0))
 
     with tab2:
-        all_plans = get_all_plans()
+        all_plans = cached_all_plans(data_version)
         if not all_plans: st.info("אנא שמור תוכנית אחת לפחות.")
         else:
             plan_options = [f"{p['plan_name']} (ID: {p['id']})" for p in all_plans]
             selected_display = st.selectbox("בחר פרויקט:", plan_options)
             selected_id = int(selected_display.split("(ID: ")[1].split(")")[0])
-            forecast = get_project_forecast(selected_id)
-            fin = get_project_financial_status(selected_id)
+            forecast = cached_forecast(data_version, selected_id)
+            fin = cached_financial_status(data_version, selected_id)
             
             # --- תיקון השגיאה של המנהל כאן ---
             days_left_val = forecast['days_to_finish']
@@ -183,39 +242,65 @@ if mode == "🏢 מנהל פרויקט":
                 cost_color = "#ef4444" if fin['budget_variance'] < 0 else "#10b981"
                 st.markdown(f"""<div class="kpi-container"><div class="kpi-icon">💰</div><div class="kpi-label">עלות נוכחית</div><div class="kpi-value">{fin['current_cost']:,.0f} ₪</div><div class="kpi-sub" style="color: {cost_color}">תקציב: {fin['budget_limit']:,.0f} ₪</div></div>""", unsafe_allow_html=True)
             
+            # הייצוא נבנה רק לפי בקשה - לא בכל רינדור של הדשבורד
+            dl1, dl2, _ = st.columns([1, 1, 2])
+            with dl1:
+                if st.session_state.get("boq_plan_ready") == selected_id:
+                    st.download_button("📥 הורדת כתב כמויות (CSV)", cached_boq_csv(data_version, [selected_id], True), file_name=f"boq_{selected_id}.csv", mime="text/csv", use_container_width=True,
+                                       on_click=lambda: st.session_state.pop("boq_plan_ready", None))
+                elif st.button("📄 הכן כתב כמויות", use_container_width=True):
+                    st.session_state.boq_plan_ready = selected_id
+                    st.rerun()
+            with dl2:
+                if st.session_state.get("boq_portfolio_ready"):
+                    st.download_button("📥 הורדת כתב כמויות - כל הפרויקטים", cached_boq_csv(data_version), file_name="boq_portfolio.csv", mime="text/csv", use_container_width=True,
+                                       on_click=lambda: st.session_state.pop("boq_portfolio_ready", None))
+                elif st.button("📄 הכן כתב כמויות - כל הפרויקטים", use_container_width=True):
+                    st.session_state.boq_portfolio_ready = True
+                    st.rerun()
+            
             g_col, t_col = st.columns([2, 1])
             with g_col:
                 st.markdown("##### קצב התקדמות")
-                df = load_stats_df()
+                bucket_label = st.radio("קיבוץ", ["יום", "שבוע", "חודש"], horizontal=True, label_visibility="collapsed")
+                bucket = {"יום": "day", "שבוע": "week", "חודש": "month"}[bucket_label]
+                df = load_stats_df(data_version, selected_id, bucket)
                 if not df.empty: st.bar_chart(df, x="תאריך", y="מטרים שבוצעו", use_container_width=True)
             with t_col:
                 st.markdown("##### דיווחים אחרונים")
-                if not df.empty: st.dataframe(df[["תאריך", "מטרים שבוצעו", "הערה"]].head(5), hide_index=True, use_container_width=True)
+                recent_df = load_recent_reports_df(data_version, selected_id)
+                if not recent_df.empty: st.dataframe(recent_df[["תאריך", "מטרים שבוצעו", "הערה"]], hide_index=True, use_container_width=True)
 
 elif mode == "👷 דיווח שטח":
     st.title("דיווח ביצוע")
     if not st.session_state.projects: st.info("אין תוכניות זמינות.")
     else:
+        import cv2
+        import numpy as np
+        from PIL import Image
+        from streamlit_drawable_canvas import st_canvas
+        from strokes import StrokeMeasurer, dilated_wall_mask, wall_kernel_size
+        Image.MAX_IMAGE_PIXELS = None
+
         plan_name = st.selectbox("בחר תוכנית:", list(st.session_state.projects.keys()))
         proj = st.session_state.projects[plan_name]
-        orig_rgb = cv2.cvtColor(proj["original"], cv2.COLOR_BGR2RGB)
-        h, w = orig_rgb.shape[:2]
-        thick_walls = proj["thick_walls"]
-        if thick_walls.shape[:2] != (h, w): thick_walls = cv2.resize(thick_walls, (w, h), interpolation=cv2.INTER_NEAREST)
-        kernel = np.ones((15, 15), np.uint8)
-        dilated_mask = cv2.dilate((thick_walls > 0).astype(np.uint8) * 255, kernel, iterations=2)
+        h, w = proj["original"].shape[:2]
+        if "walls_dilated" not in proj: proj["walls_dilated"] = dilated_wall_mask(proj["thick_walls"], (w, h), wall_kernel_size(proj.get("thickness_hist")))
+        dilated_mask = proj["walls_dilated"]
         
         col_opacity, col_spacer = st.columns([2, 1])
         with col_opacity: opacity = st.slider("עוצמת הדגשת קירות", 0.0, 1.0, 0.4)
-        overlay = np.zeros_like(orig_rgb)
-        overlay[dilated_mask > 0] = [0, 120, 255]
-        combined = cv2.addWeighted(orig_rgb, 1-opacity, overlay, opacity, 0).astype(np.uint8)
-        
-        bg_image = Image.fromarray(combined).convert("RGB")
         c_width = 1000
         factor = c_width / w
         c_height = int(h * factor)
-        bg_image_resized = bg_image.resize((c_width, c_height))
+        # תמונת הרקע של הקנבס נבנית מחדש רק כשהשקיפות משתנה (ולא בכל קו שמסומן)
+        if proj.get("canvas_bg", (None,))[0] != opacity:
+            orig_rgb = cv2.cvtColor(proj["original"], cv2.COLOR_BGR2RGB)
+            overlay = np.zeros_like(orig_rgb)
+            overlay[dilated_mask > 0] = [0, 120, 255]
+            combined = cv2.addWeighted(orig_rgb, 1-opacity, overlay, opacity, 0).astype(np.uint8)
+            proj["canvas_bg"] = (opacity, Image.fromarray(combined).convert("RGB").resize((c_width, c_height)))
+        bg_image_resized = proj["canvas_bg"][1]
         
         st.markdown("**סמן את הקירות שבנית היום (בירוק):**")
         canvas_key = f"canvas_{plan_name}_{opacity}"
@@ -224,43 +309,35 @@ elif mode == "👷 דיווח שטח":
             width=c_width, height=c_height, drawing_mode="line", key=canvas_key, update_streamlit=True
         )
         
-        if canvas.json_data and canvas.json_data["objects"]:
-            w_mask = np.zeros((c_height, c_width), dtype=np.uint8)
-            df_obj = pd.json_normalize(canvas.json_data["objects"])
-            for _, obj in df_obj.iterrows():
-                if 'left' in obj and 'top' in obj:
-                    l, t = int(obj['left']), int(obj['top'])
-                    if 'x1' in obj:
-                        p1 = (l + int(obj['x1']), t + int(obj['y1']))
-                        p2 = (l + int(obj['x2']), t + int(obj['y2']))
-                        cv2.line(w_mask, p1, p2, 255, 5)
+        measurer_key = f"strokes_{canvas_key}"
+        if measurer_key not in st.session_state:
             walls_res = cv2.resize(dilated_mask, (c_width, c_height), interpolation=cv2.INTER_NEAREST)
-            intersection = cv2.bitwise_and(w_mask, walls_res)
-            pixels = cv2.countNonZero(intersection)
-            meters = (pixels / factor) / proj["scale"] if proj["scale"] > 0 else 0
+            st.session_state[measurer_key] = StrokeMeasurer(walls_res)
+        measurer = st.session_state[measurer_key]
+        
+        if canvas.json_data and canvas.json_data["objects"]:
+            measurer.update(canvas.json_data["objects"])
+            meters = measurer.meters(factor, proj["scale"])
             
             st.success(f"✅ נמדדו: **{meters:.2f} מטר**")
             note = st.text_input("הערה לדיווח")
             if st.button("🚀 שלח דיווח", type="primary", use_container_width=True):
-                 from database import get_plan_by_filename, save_plan
-                 rec = get_plan_by_filename(plan_name)
-                 if rec:
-                     pid = rec['id']
-                 else:
-                     # יצירת תוכנית חדשה אם לא קיימת
-                     metadata_json = json.dumps(proj.get("metadata", {}), ensure_ascii=False)
-                     pid = save_plan(
-                         plan_name, 
-                         proj["metadata"].get("plan_name", plan_name), 
-                         "", 
-                         proj["scale"], 
-                         proj["raw_pixels"], 
-                         metadata_json,
-                         None,  # target_date
-                         0,     # budget_limit
-                         0,     # cost_per_meter
-                         "{}"   # material_estimate
-                     )
-                 save_progress_report(pid, meters, note)
+                 from ingest import record_progress_report
+                 lines = [((p1[0] / factor, p1[1] / factor), (p2[0] / factor, p2[1] / factor)) for p1, p2 in measurer.lines]
+                 # התוכנית (אם עוד לא נשמרה), הדיווח ומפת הכיסוי - בטרנזקציה אחת
+                 _, _, new_pixels = record_progress_report(meters, note, plan={
+                     "filename": plan_name,
+                     "plan_name": proj["metadata"].get("plan_name", plan_name),
+                     "confirmed_scale": proj["scale"],
+                     "raw_pixel_count": proj["raw_pixels"],
+                     "metadata_json": json.dumps(proj.get("metadata", {}), ensure_ascii=False),
+                 }, coverage=(proj["skeleton"], lines))
                  st.balloons()
-                 st.success("הדיווח נשלח!")
\ No newline at end of file
+                 st.success("הדיווח נשלח!")
+                 if proj["scale"] > 0: st.caption(f"מתוכם קירות שלא דווחו קודם: {new_pixels / proj['scale']:.2f} מ'")
+
+if os.environ.get("CONTECH_TIMING"):
+    st.sidebar.caption(f"⏱️ ריצת הסקריפט: {(time.perf_counter() - _RUN_START) * 1000:.0f} ms")
+if page_queries is not None:
+    db_metrics.stop_tracking()
+    st.sidebar.caption(f"🗄️ {len(page_queries)} שאילתות · {sum(q['seconds'] for q in page_queries) * 1000:.0f} ms ב-SQLite")
@@ -0,0 +1,77 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+_SCRIPT_MS = re.compile(r"ריצת הסקריפט: (\d+) ms")
+
+
+def _script_ms(at) -> float:
+    """זמן הסקריפט עצמו כפי שהאפליקציה מדווחת (CONTECH_TIMING) - בלי תקורת ה-AppTest"""
+    for caption in at.sidebar.caption:
+        match = _SCRIPT_MS.search(caption.value)
+        if match:
+            return float(match.group(1))
+    return float("nan")
+
+
+def _measure(runs: int) -> dict:
+    """
+    ריצה אחת של האפליקציה בתהליך הנוכחי: ריצה ראשונה (קרה) ואחריה ריצות חוזרות
+    זמן קיר כולל ייבוא streamlit ותקורת AppTest; זמן סקריפט - רק הרצת app.py
+    """
+    os.environ["CONTECH_TIMING"] = "1"
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_FILE, default_timeout=120).run()
+    cold = time.perf_counter() - start
+    cold_script = _script_ms(at)
+
+    def timed(action):
+        t = time.perf_counter()
+        action()
+        return (time.perf_counter() - t) * 1000, _script_ms(at)
+
+    reruns = [timed(at.run) for _ in range(runs)]
+    interactions = {}
+    if at.radio:
+        interactions["switch_mode"] = timed(lambda: at.radio[0].set_value(at.radio[0].options[1]).run())
+        interactions["switch_back"] = timed(lambda: at.radio[0].set_value(at.radio[0].options[0]).run())
+    return {
+        "cold_start_ms": cold * 1000,
+        "cold_script_ms": cold_script,
+        "rerun_ms": statistics.median(r[0] for r in reruns),
+        "rerun_script_ms": statistics.median(r[1] for r in reruns),
+        "interactions_ms": interactions,
+        "exceptions": [e.value for e in at.exception],
+    }
+
+
+def measure_app(runs: int = 10) -> dict:
+    """מודד בתהליך נקי (בלי מודולים טעונים מראש) - כדי שהריצה הראשונה תשקף הפעלה קרה"""
+    out = subprocess.run([sys.executable, __file__, "--child", "--runs", str(runs)],
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="זמן הפעלה קרה וזמן ריצה חוזרת של app.py")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        print(json.dumps(_measure(args.runs)))
+    else:
+        result = measure_app(args.runs)
+        print(f"הפעלה קרה: {result['cold_start_ms']:.0f} ms (סקריפט: {result['cold_script_ms']:.0f} ms)")
+        print(f"ריצה חוזרת (חציון): {result['rerun_ms']:.0f} ms (סקריפט: {result['rerun_script_ms']:.0f} ms)")
+        for name, (wall_ms, script_ms) in result["interactions_ms"].items():
+            print(f"  {name}: {wall_ms:.0f} ms (סקריפט: {script_ms:.0f} ms)")
+        for exc in result["exceptions"]:
+            print(f"שגיאה: {exc}")
@@ -0,0 +1,167 @@
+import argparse
+import statistics
+import time
+from typing import Dict, List, Optional
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+import pandas as pd
+
+from analyzer import ANALYSIS_PROFILES, FloorPlanAnalyzer
+
+# מ"מ על הנייר לכל נקודת PDF
+MM_PER_PT = 25.4 / 72
+
+
+def _page_width_pt(pdf_path: str) -> float:
+    doc = fitz.open(pdf_path)
+    try:
+        return doc[0].rect.width
+    finally:
+        doc.close()
+
+
+def run_profile(pdf_path: str, analyzer: FloorPlanAnalyzer, repeat: int = 3) -> Dict:
+    """
+    מריץ ניתוח מלא כמה פעמים ומודד זמן
+    האורך מנורמל לנקודות PDF כדי שיהיה בר-השוואה בין רזולוציות שונות
+    """
+    times = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        pixels, _, _, image, _ = analyzer.process_file(pdf_path)
+        times.append(time.perf_counter() - start)
+    px_per_pt = image.shape[1] / _page_width_pt(pdf_path)
+    return {
+        "seconds": statistics.median(times),
+        "pixels": pixels,
+        "image": f"{image.shape[1]}x{image.shape[0]}",
+        "length_pt": pixels / px_per_pt,
+    }
+
+
+def benchmark_profiles(pdf_paths: List[str], profiles: Optional[Dict[str, Dict]] = None, repeat: int = 3,
+                       paper_scale: Optional[float] = None, reference: Optional[Dict[str, float]] = None,
+                       reference_profile: str = "precise") -> pd.DataFrame:
+    """
+    זמן מול שגיאת אורך לכל פרופיל ולכל תוכנית
+    profiles: שם -> פרמטרים ל-FloorPlanAnalyzer (ברירת מחדל - כל הפרופילים המוגדרים)
+    paper_scale: מכנה קנה המידה (לדוגמה 50 עבור 1:50) - לחישוב אורך במטרים
+    reference: אורך אמיתי במטרים לכל קובץ; אם חסר - הפרופיל reference_profile משמש כייחוס
+    """
+    profiles = profiles or {name: {"profile": name} for name in ANALYSIS_PROFILES}
+    analyzers = {name: FloorPlanAnalyzer(**kwargs) for name, kwargs in profiles.items()}
+    reference = reference or {}
+    rows = []
+    for pdf_path in pdf_paths:
+        results = {name: run_profile(pdf_path, analyzer, repeat) for name, analyzer in analyzers.items()}
+        ref_m = reference.get(pdf_path)
+        ref_pt = ref_m * 1000 / MM_PER_PT / paper_scale if ref_m and paper_scale else None
+        if ref_pt is None and reference_profile in results:
+            ref_pt = results[reference_profile]["length_pt"]
+        for name, res in results.items():
+            row = {"file": pdf_path, "profile": name, "analyzer": analyzers[name].profile, **res}
+            if paper_scale:
+                row["length_m"] = res["length_pt"] * MM_PER_PT * paper_scale / 1000
+            row["error_pct"] = abs(res["length_pt"] - ref_pt) / ref_pt * 100 if ref_pt else None
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+class _AreaOnlyAnalyzer(FloorPlanAnalyzer):
+    """סינון הרכיבים הישן - לפי שטח בלבד - כייחוס לבדיקת התוכנית הנקייה"""
+
+    def classify_components(self, stats: np.ndarray, stroke: np.ndarray) -> np.ndarray:
+        return stats[:, cv2.CC_STAT_AREA] >= self.params["min_component_area"]
+
+
+def synthetic_clean_plan(max_dim: int) -> np.ndarray:
+    """
+    תוכנית נקייה (בלי טקסט, מידות וקווקוו) בגודל של הפרופיל:
+    רשת קירות, קטעי קיר קצרים בין פתחי דלתות, פינות L ו-T ליד פתחים ועמודים - כל אלה חייבים לשרוד את סינון הרכיבים
+    """
+    h, w = int(max_dim * 0.7), max_dim
+    img = np.full((h, w, 3), 255, np.uint8)
+    t = max(4, max_dim // 180)  # עובי קיר
+    x0, x1, y0, y1 = int(w * 0.2), int(w * 0.8), int(h * 0.2), int(h * 0.8)
+    for a, b in [((x0, y0), (x1, y0)), ((x0, y1), (x1, y1)), ((x0, y0), (x0, y1)), ((x1, y0), (x1, y1)),
+                 ((w // 2, y0), (w // 2, y1))]:
+        cv2.line(img, a, b, (0, 0, 0), t)
+    # מחיצה עם פתחים: קטעי קיר קצרים (פי 4 מהעובי) שכל אחד הוא רכיב נפרד
+    y_mid, seg = h // 2, 4 * t
+    for x in range(x0 + 3 * t, w // 2 - seg - 3 * t, seg + 3 * t):
+        cv2.line(img, (x, y_mid), (x + seg, y_mid), (0, 0, 0), t)
+    # עמודים בודדים
+    col = int(2.5 * t)
+    for cx in range(w // 2 + 4 * t, x1 - col - 3 * t, 8 * t):
+        cv2.rectangle(img, (cx, y_mid), (cx + col, y_mid + col), (0, 0, 0), -1)
+    # חזרות קיר בצורת L (משמאל למחיצה) ו-T (מימין) - מילוי התיבה שלהן נמוך כמו של מילה
+    y_ret, arm = (y_mid + y1) // 2, 4 * t
+    for x in range(x0 + 3 * t, w // 2 - arm - 3 * t, arm + 4 * t):
+        cv2.line(img, (x, y_ret), (x + arm, y_ret), (0, 0, 0), t)
+        cv2.line(img, (x, y_ret), (x, y_ret + arm), (0, 0, 0), t)
+    for x in range(w // 2 + arm + 3 * t, x1 - arm - 3 * t, 2 * arm + 4 * t):
+        cv2.line(img, (x - arm, y_ret), (x + arm, y_ret), (0, 0, 0), t)
+        cv2.line(img, (x, y_ret), (x, y_ret + arm), (0, 0, 0), t)
+    return img
+
+
+def check_clean_plan(profiles: Optional[List[str]] = None, tolerance: float = 0.01) -> pd.DataFrame:
+    """
+    בדיקה שסינון הרכיבים לא מוריד קירות: בתוכנית נקייה אורך השלד זהה לסינון לפי שטח בלבד
+    מחזירה: טבלה לכל פרופיל עם ok=False אם ההפרש גדול מ-tolerance
+    """
+    rows = []
+    for name in profiles or list(ANALYSIS_PROFILES):
+        analyzer, reference = FloorPlanAnalyzer(name), _AreaOnlyAnalyzer(name)
+        image = synthetic_clean_plan(analyzer.params["max_dim"])
+        pixels = cv2.countNonZero(analyzer.skeletonize_tiles(analyzer.preprocess_image(image))[0])
+        ref_pixels = cv2.countNonZero(reference.skeletonize_tiles(reference.preprocess_image(image))[0])
+        diff = abs(pixels - ref_pixels) / max(ref_pixels, 1)
+        rows.append({"profile": name, "pixels": pixels, "area_only_pixels": ref_pixels,
+                     "diff_pct": diff * 100, "ok": diff <= tolerance})
+    return pd.DataFrame(rows)
+
+
+def _parse_params(items: List[str]) -> Dict:
+    params = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        params[key] = float(value) if key == "margin_percent" else int(value)
+    return params
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="השוואת פרופילי ניתוח: זמן מול שגיאת אורך")
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--profiles", nargs="+", choices=sorted(ANALYSIS_PROFILES), default=list(ANALYSIS_PROFILES))
+    parser.add_argument("--set", nargs="+", default=[], metavar="KEY=VALUE",
+                        help="מוסיף הרצת custom על בסיס balanced, לדוגמה: --set dpi=150 max_dim=1600")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--paper-scale", type=float, help="מכנה קנה המידה, לדוגמה 50 עבור 1:50")
+    parser.add_argument("--reference-m", type=float, help="אורך קירות אמיתי (מטר) - לקובץ יחיד")
+    parser.add_argument("--csv", help="שמירת התוצאות לקובץ CSV")
+    parser.add_argument("--check-clean", action="store_true",
+                        help="בדיקה שסינון הרכיבים שומר את אורך השלד בתוכנית נקייה (יוצא עם קוד 1 אם לא)")
+    args = parser.parse_args()
+
+    if args.check_clean:
+        check = check_clean_plan(args.profiles)
+        print(check.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+        raise SystemExit(0 if check["ok"].all() else 1)
+    if not args.pdfs:
+        parser.error("נדרש לפחות קובץ PDF אחד (או --check-clean)")
+
+    profiles = {name: {"profile": name} for name in args.profiles}
+    if args.set:
+        profiles["custom"] = {"profile": "balanced", **_parse_params(args.set)}
+        try:
+            FloorPlanAnalyzer(**profiles["custom"])
+        except ValueError as e:
+            parser.error(str(e))
+    reference = {args.pdfs[0]: args.reference_m} if args.reference_m and len(args.pdfs) == 1 else None
+    df = benchmark_profiles(args.pdfs, profiles, args.repeat, args.paper_scale, reference)
+    print(df.drop(columns=["analyzer"]).to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+    if args.csv:
+        df.to_csv(args.csv, index=False)
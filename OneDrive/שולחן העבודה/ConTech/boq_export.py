@@ -0,0 +1,195 @@
+import argparse
+import csv
+import importlib.util
+import io
+import json
+import os
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import analysis_cache
+from database import iter_plans, get_latest_revision, calculate_material_estimates
+from estimates import BLOCK_TYPES, aggregate_by_type
+
+# openpyxl / pyarrow נטענים רק בייצוא עצמו (pyarrow לבדו מאט את טעינת האפליקציה)
+XLSX_AVAILABLE = importlib.util.find_spec("openpyxl") is not None
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+BOQ_COLUMNS = ["plan_id", "plan_name", "item", "quantity", "unit",
+               "segment_id", "x", "y", "width", "height"]
+
+# כמה שורות נכתבות בכל batch ל-Parquet
+PARQUET_BATCH_ROWS = 10000
+
+
+def boq_items(plan_id, plan_name, total_length_meters, materials: Dict) -> List[Dict]:
+    """
+    שורות כתב הכמויות של תוכנית אחת (ללא פירוט מקטעים)
+    כשיש פירוט לפי עובי, שורות הסיכום הן סכום הפירוט (גם בהערכות שנשמרו לפני כן)
+    """
+    by_type = materials.get("by_block_type") or {}
+    materials = {**materials, **(aggregate_by_type(by_type) or {})}
+    items = [
+        ("Wall Construction", total_length_meters, "m"),
+        ("Wall Area", materials.get("wall_area_sqm", 0), "m2"),
+        ("Blocks", materials.get("block_count", 0), "unit"),
+        ("Cement", materials.get("cement_cubic_meters", 0), "m3"),
+        ("Sand", materials.get("sand_cubic_meters", 0), "m3"),
+    ]
+    for block_type, est in by_type.items():
+        thickness_cm = BLOCK_TYPES.get(block_type, {}).get("thickness_cm", block_type)
+        items.append((f"Wall {thickness_cm} cm", est.get("length_m", 0), "m"))
+        items.append((f"Blocks {thickness_cm} cm", est.get("block_count", 0), "unit"))
+    return [_row(plan_id, plan_name, item, qty, unit) for item, qty, unit in items]
+
+
+def _row(plan_id, plan_name, item, quantity, unit, segment_id=None, x=None, y=None, width=None, height=None):
+    return {"plan_id": plan_id, "plan_name": plan_name, "item": item,
+            "quantity": float(quantity or 0), "unit": unit, "segment_id": segment_id,
+            "x": x, "y": y, "width": width, "height": height}
+
+
+def _plan_materials(plan: Dict, total_length: float) -> Dict:
+    try:
+        materials = json.loads(plan.get("material_estimate") or "{}")
+    except ValueError:
+        materials = {}
+    return materials or calculate_material_estimates(total_length)
+
+
+def _iter_segments(plan: Dict, scale: float) -> Iterator[Dict]:
+    """מקטעי קיר (רכיבים קשירים בשלד) מתוך מטמון הניתוח של הגרסה האחרונה"""
+    import cv2
+
+    rev = get_latest_revision(plan["filename"])
+    data = analysis_cache.load_arrays(rev["cache_key"]) if rev else None
+    if data is None or scale <= 0:
+        return
+    skeleton = analysis_cache.unpack_mask(data["skeleton"], data["shape"])
+    n, _, stats, _ = cv2.connectedComponentsWithStats(skeleton, connectivity=8)
+    del skeleton
+    for i in range(1, n):
+        x, y, w, h, area = (int(v) for v in stats[i])
+        yield _row(plan["id"], plan["plan_name"], "Wall Segment", area / scale, "m",
+                   segment_id=i, x=x, y=y, width=w, height=h)
+
+
+def iter_boq_rows(plan_ids: Optional[List[int]] = None, detail: bool = False) -> Iterator[Dict]:
+    """
+    מזרים שורות כתב כמויות מהמסד (ומהמטמון אם detail=True)
+    זיכרון קבוע - תוכנית אחת בכל רגע, בלי קשר למספר התוכניות
+    """
+    for plan in iter_plans(plan_ids):
+        try:
+            scale = float(plan.get("confirmed_scale") or 0)
+        except (TypeError, ValueError):
+            scale = 0.0
+        total_length = (plan.get("raw_pixel_count") or 0) / scale if scale > 0 else 0.0
+        yield from boq_items(plan["id"], plan["plan_name"], total_length, _plan_materials(plan, total_length))
+        if detail:
+            yield from _iter_segments(plan, scale)
+
+
+def _open_text(target):
+    if isinstance(target, (str, os.PathLike)):
+        return open(target, "w", encoding="utf-8-sig", newline=""), True
+    return target, False
+
+
+def write_csv(rows: Iterable[Dict], target) -> int:
+    f, owned = _open_text(target)
+    try:
+        writer = csv.DictWriter(f, fieldnames=BOQ_COLUMNS)
+        writer.writeheader()
+        count = 0
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+    finally:
+        if owned:
+            f.close()
+
+
+def write_jsonl(rows: Iterable[Dict], target) -> int:
+    f, owned = _open_text(target)
+    try:
+        count = 0
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+        return count
+    finally:
+        if owned:
+            f.close()
+
+
+def write_xlsx(rows: Iterable[Dict], target) -> int:
+    if not XLSX_AVAILABLE:
+        raise ImportError("ייצוא XLSX דורש את החבילה openpyxl")
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)  # כתיבה זורמת, בלי להחזיק את הגיליון בזיכרון
+    ws = wb.create_sheet("BoQ")
+    ws.append(BOQ_COLUMNS)
+    count = 0
+    for row in rows:
+        ws.append([row[c] for c in BOQ_COLUMNS])
+        count += 1
+    wb.save(target)
+    return count
+
+
+def write_parquet(rows: Iterable[Dict], target) -> int:
+    if not PARQUET_AVAILABLE:
+        raise ImportError("ייצוא Parquet דורש את החבילה pyarrow")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([
+        ("plan_id", pa.int64()), ("plan_name", pa.string()), ("item", pa.string()),
+        ("quantity", pa.float64()), ("unit", pa.string()), ("segment_id", pa.int64()),
+        ("x", pa.int64()), ("y", pa.int64()), ("width", pa.int64()), ("height", pa.int64()),
+    ])
+    rows = iter(rows)
+    count = 0
+    with pq.ParquetWriter(target, schema) as writer:
+        while True:
+            batch = list(islice(rows, PARQUET_BATCH_ROWS))
+            if not batch:
+                break
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            count += len(batch)
+    return count
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "xlsx": write_xlsx, "parquet": write_parquet}
+
+
+def export_boq(target, fmt: Optional[str] = None, plan_ids: Optional[List[int]] = None,
+               detail: bool = False) -> int:
+    """
+    מייצא כתב כמויות לתוכנית אחת / כמה תוכניות / כל הפורטפוליו (plan_ids=None)
+    fmt: csv / jsonl / xlsx / parquet (ברירת מחדל - לפי סיומת הקובץ)
+    מחזירה: מספר השורות שנכתבו
+    """
+    if fmt is None:
+        fmt = os.path.splitext(str(target))[1].lstrip(".").lower() or "csv"
+    if fmt not in WRITERS:
+        raise ValueError(f"פורמט לא נתמך: {fmt}")
+    return WRITERS[fmt](iter_boq_rows(plan_ids, detail), target)
+
+
+def export_boq_csv_bytes(plan_ids: Optional[List[int]] = None, detail: bool = False) -> bytes:
+    buf = io.StringIO()
+    write_csv(iter_boq_rows(plan_ids, detail), buf)
+    return buf.getvalue().encode("utf-8-sig")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ייצוא כתב כמויות (BoQ)")
+    parser.add_argument("output", help="קובץ יעד: .csv / .jsonl / .xlsx / .parquet")
+    parser.add_argument("--plan-id", type=int, action="append", dest="plan_ids", help="ניתן לחזור מספר פעמים")
+    parser.add_argument("--detail", action="store_true", help="כולל פירוט לפי מקטעי קיר")
+    parser.add_argument("--format", dest="fmt", choices=sorted(WRITERS))
+    args = parser.parse_args()
+    n = export_boq(args.output, args.fmt, args.plan_ids, args.detail)
+    print(f"נכתבו {n} שורות ל-{args.output}")
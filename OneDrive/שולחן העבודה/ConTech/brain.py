@@ -1,14 +1,12 @@
 from database import get_all_plans, get_plan_by_filename
 from typing import Optional, List, Dict
 import difflib
+import importlib.util
 import json
 import re
 
-try:
-    from groq import Groq
-    GROQ_AVAILABLE = True
-except ImportError:
-    GROQ_AVAILABLE = False
+# groq נטען רק כשבאמת קוראים ל-LLM (הייבוא שלו איטי)
+GROQ_AVAILABLE = importlib.util.find_spec("groq") is not None
 
 def find_similar_plans(plan_name: str, threshold: float = 0.6) -> List[Dict]:
     """
@@ -34,9 +32,13 @@ def find_similar_plans(plan_name: str, threshold: float = 0.6) -> List[Dict]:
     
     return similar_plans
 
-def suggest_scale(filename: str, extracted_plan_name: Optional[str] = None) -> Optional[float]:
+def suggest_scale(filename: str, extracted_plan_name: Optional[str] = None,
+                  fingerprint: Optional[str] = None, image_width: Optional[int] = None,
+                  content_aspect: Optional[float] = None) -> Optional[float]:
     """
     מציע סקלה מומלצת על בסיס למידה מתוכניות קודמות
+    fingerprint / image_width / content_aspect: טביעת הפריסה, רוחב תמונת הניתוח ויחס תחום הקירות -
+    לזיהוי גיליונות זהים חזותית (למשל "קומה 3" ו-"Floor 3 typ.") גם כשהשמות שונים
     מחזירה: סקלה מומלצת (pixels_per_meter) או None אם אין המלצה
     """
     # קודם, בודקים אם יש לנו כבר תוכנית עם השם הזה
@@ -45,6 +47,21 @@ def suggest_scale(filename: str, extracted_plan_name: Optional[str] = None) -> O
         # אם יש לנו כיול מאושר, נחזיר אותו
         return existing_plan['confirmed_scale']
     
+    # גיליון עם פריסת קירות כמעט זהה
+    if fingerprint and content_aspect:
+        from fingerprint_index import find_visually_similar
+        from revisions import FINGERPRINT_BITS, LAYOUT_MATCH_MAX_DISTANCE, LAYOUT_MAX_ASPECT_DIFF
+        for item in find_visually_similar(fingerprint, LAYOUT_MATCH_MAX_DISTANCE, exclude_filename=filename,
+                                          aspect=content_aspect, max_aspect_diff=LAYOUT_MAX_ASPECT_DIFF):
+            plan = item['plan']
+            scale = plan['confirmed_scale']
+            if image_width and plan.get('width'):
+                # פיקסלים למטר תלויים ברזולוציית הניתוח (פרופיל) - מנרמלים לפי רוחב התמונה
+                scale = scale * image_width / plan['width']
+            print(f"🧠 מוח: מצאתי גיליון דומה חזותית '{plan['plan_name']}' (מרחק: {item['distance']}/{FINGERPRINT_BITS})")
+            print(f"   המלצה: סקלה של {scale:.1f} פיקסלים למטר")
+            return scale
+    
     # אם יש שם תוכנית, נחפש תוכניות דומות
     if extracted_plan_name:
         similar_plans = find_similar_plans(extracted_plan_name, threshold=0.7)
@@ -121,6 +138,7 @@ def process_plan_metadata(raw_text: str, api_key: Optional[str] = None) -> Dict[
         return _extract_metadata_basic(raw_text)
     
     try:
+        from groq import Groq
         client = Groq(api_key=api_key)
         
         prompt = f"""אתה מומחה לבנייה ואדריכלות. נתון לך טקסט שמוצא מתוכנית בנייה (PDF) באמצעות OCR.
@@ -0,0 +1,299 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterator, List, Optional
+
+import database
+from database import (
+    get_db_connection, create_indexes, drop_indexes,
+    create_version_triggers, drop_version_triggers, bump_data_version
+)
+
+# שורות לכל טרנזקציה
+BATCH_ROWS = 100000
+REPORT_INDEXES = ["idx_reports_plan_date", "idx_reports_date"]
+# הערכת גודל שורת דיווח בקובץ - להחלטה האם לדחות את בניית האינדקסים
+APPROX_REPORT_ROW_BYTES = 48
+
+PLAN_COLUMNS = ["filename", "plan_name", "extracted_scale", "confirmed_scale", "raw_pixel_count",
+                "metadata_json", "target_date", "budget_limit", "cost_per_meter", "material_estimate"]
+REPORT_COLUMNS = ["plan_id", "report_date", "meters_built", "worker_name", "note"]
+
+
+class RowError(ValueError):
+    pass
+
+
+def iter_records(path: str) -> Iterator:
+    """
+    קורא CSV או JSONL שורה-שורה
+    ב-JSONL כל שורה מוחזרת כטקסט ומפוענחת ב-_validated - שורה פגומה נדחית ולא עוצרת את הייבוא
+    """
+    if path.lower().endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            yield from f
+    else:
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            yield from csv.DictReader(f)
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _float(value, field, default=0.0, minimum=None):
+    if _blank(value):
+        return default
+    try:
+        v = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"{field}: ערך לא מספרי '{value}'")
+    if minimum is not None and v < minimum:
+        raise RowError(f"{field}: ערך קטן מ-{minimum}")
+    return v
+
+
+def _timestamp(value, field) -> Optional[str]:
+    if _blank(value):
+        return None
+    text = str(value).strip().replace("T", " ")
+    try:
+        dt = datetime.fromisoformat(text)
+    except ValueError:
+        raise RowError(f"{field}: תאריך לא תקין '{value}'")
+    if dt.tzinfo is not None or len(text) != 19:
+        text = dt.strftime("%Y-%m-%d %H:%M:%S")
+    return text
+
+
+def _text(value, default=""):
+    """ערך טקסט מ-CSV / JSONL; אובייקט JSON נשמר כטקסט JSON"""
+    if _blank(value):
+        return default
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _date(value, field) -> Optional[str]:
+    ts = _timestamp(value, field)
+    return ts[:10] if ts else None
+
+
+def validate_plan(rec: Dict) -> tuple:
+    if isinstance(rec.get("filename"), (dict, list)):
+        raise RowError("filename אינו טקסט")
+    filename = _text(rec.get("filename")).strip()
+    if not filename:
+        raise RowError("filename חסר")
+    raw = _float(rec.get("raw_pixel_count"), "raw_pixel_count", minimum=0)
+    return (
+        filename,
+        _text(rec.get("plan_name"), filename.replace(".pdf", "")),
+        _text(rec.get("extracted_scale")),
+        _float(rec.get("confirmed_scale"), "confirmed_scale", minimum=0),
+        int(raw),
+        _text(rec.get("metadata_json"), "{}"),
+        _date(rec.get("target_date"), "target_date"),
+        _float(rec.get("budget_limit"), "budget_limit", minimum=0),
+        _float(rec.get("cost_per_meter"), "cost_per_meter", minimum=0),
+        _text(rec.get("material_estimate"), "{}"),
+    )
+
+
+def validate_report(rec: Dict, plan_ids_by_filename: Dict[str, int], known_ids: set) -> tuple:
+    """plan_filename קודם ל-plan_id - כדי שייבוא מהתקנה אחרת ימופה לפי שם הקובץ"""
+    plan_filename = rec.get("plan_filename")
+    if not _blank(plan_filename):
+        plan_id = plan_ids_by_filename.get(str(plan_filename).strip())
+        if plan_id is None:
+            raise RowError(f"תוכנית לא קיימת: {plan_filename}")
+    else:
+        try:
+            plan_id = int(rec.get("plan_id"))
+        except (TypeError, ValueError):
+            raise RowError("plan_id / plan_filename חסר")
+        if plan_id not in known_ids:
+            raise RowError(f"plan_id לא קיים: {plan_id}")
+    report_date = _timestamp(rec.get("report_date"), "report_date") or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    meters = _float(rec.get("meters_built"), "meters_built", default=None, minimum=0)
+    if meters is None:
+        raise RowError("meters_built חסר")
+    return (plan_id, report_date, meters, _text(rec.get("worker_name"), None), _text(rec.get("note")))
+
+
+def _parse(rec) -> Dict:
+    if isinstance(rec, str):
+        try:
+            rec = json.loads(rec)
+        except json.JSONDecodeError as e:
+            raise RowError(f"JSON לא תקין: {e.msg}")
+    if not isinstance(rec, dict):
+        raise RowError("השורה אינה אובייקט")
+    return rec
+
+
+def _validated(records: Iterator, validate, errors: List, max_errors: int) -> Iterator[tuple]:
+    """line_no: מספר השורה בקובץ JSONL, או מספר הרשומה ב-CSV (בלי שורת הכותרת)"""
+    for line_no, rec in enumerate(records, start=1):
+        if isinstance(rec, str) and not rec.strip():
+            continue
+        try:
+            yield validate(_parse(rec))
+        except (RowError, TypeError, AttributeError) as e:
+            errors.append((line_no, str(e)))
+            if len(errors) > max_errors:
+                raise RowError(f"יותר מדי שורות שגויות ({len(errors)}), הייבוא הופסק") from e
+
+
+def _bulk_connection():
+    """
+    חיבור ייעודי מחוץ למאגר: ה-PRAGMA המקלים (synchronous=NORMAL וכו') נשארים עליו בלבד
+    ולא עוברים לכתיבות הרגילות של האפליקציה אחרי ה-close
+    """
+    conn = sqlite3.connect(database.DB_NAME, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -64000")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+# הייבוא מיועד למסד שלא נכתב אליו באותו זמן (offline): טריגרי הגרסה ואינדקסי הדיווחים מוסרים
+# ברמת המסד כולו, כך שכתיבות של האפליקציה / ה-API בזמן הייבוא לא מקדמות את data_version
+# (המטמון מתעדכן רק בסוף הייבוא). הם משוחזרים ב-finally גם כשהייבוא נכשל; אם התהליך נהרג
+# באמצע - init_database (בכל הפעלה של האפליקציה, ה-API וה-CLI הזה) יוצר אותם מחדש
+def _restore_version_triggers(conn, tables):
+    if conn.in_transaction:  # אצווה שנכשלה באמצע
+        conn.rollback()
+    create_version_triggers(conn, tables)
+    bump_data_version(conn)
+    conn.commit()
+
+
+def import_plans(path: str, max_errors: int = 1000) -> Dict:
+    """
+    ייבוא תוכניות - upsert לפי filename (מזהה התוכנית נשמר אם היא כבר קיימת)
+    מחזירה: {"imported", "errors": [(שורה, סיבה)]}
+    """
+    errors: List = []
+    rows = _validated(iter_records(path), validate_plan, errors, max_errors)
+    conn = _bulk_connection()
+    imported = 0
+    try:
+        drop_version_triggers(conn, ["plans"])
+        while True:
+            batch = list(islice(rows, BATCH_ROWS))
+            if not batch:
+                break
+            conn.executemany(f'''INSERT INTO plans ({", ".join(PLAN_COLUMNS)})
+                VALUES ({", ".join("?" * len(PLAN_COLUMNS))})
+                ON CONFLICT(filename) DO UPDATE SET
+                {", ".join(f"{c} = excluded.{c}" for c in PLAN_COLUMNS[1:])}''', batch)
+            conn.commit()
+            imported += len(batch)
+    finally:
+        _restore_version_triggers(conn, ["plans"])
+        conn.close()
+    return {"imported": imported, "errors": errors}
+
+
+def import_reports(path: str, max_errors: int = 1000, defer_indexes: Optional[bool] = None) -> Dict:
+    """
+    ייבוא דיווחי התקדמות ב-executemany בטרנזקציות גדולות
+    defer_indexes: האינדקסים המשניים מוסרים בזמן הטעינה ונבנים מחדש פעם אחת בסופה.
+    None - אוטומטי: רק כשהקובץ גדול ביחס לטבלה (בנייה מחדש עולה ביחס לכל הטבלה)
+    מחזירה: {"imported", "errors": [(שורה, סיבה)]}
+    """
+    conn = _bulk_connection()
+    try:
+        if defer_indexes is None:
+            existing = conn.execute("SELECT COALESCE(MAX(id), 0) FROM progress_reports").fetchone()[0]
+            defer_indexes = os.path.getsize(path) / APPROX_REPORT_ROW_BYTES >= existing
+        plan_ids_by_filename = {r["filename"]: r["id"] for r in conn.execute("SELECT id, filename FROM plans")}
+        known_ids = set(plan_ids_by_filename.values())
+        errors: List = []
+        rows = _validated(iter_records(path),
+                          lambda rec: validate_report(rec, plan_ids_by_filename, known_ids),
+                          errors, max_errors)
+        imported = 0
+        try:
+            drop_version_triggers(conn, ["progress_reports"])
+            if defer_indexes:
+                drop_indexes(conn, REPORT_INDEXES)
+            conn.commit()
+            while True:
+                batch = list(islice(rows, BATCH_ROWS))
+                if not batch:
+                    break
+                conn.executemany(f'''INSERT INTO progress_reports ({", ".join(REPORT_COLUMNS)})
+                    VALUES ({", ".join("?" * len(REPORT_COLUMNS))})''', batch)
+                conn.commit()
+                imported += len(batch)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if defer_indexes:
+                create_indexes(conn, REPORT_INDEXES)
+            _restore_version_triggers(conn, ["progress_reports"])
+    finally:
+        conn.close()
+    return {"imported": imported, "errors": errors}
+
+
+DUMP_QUERIES = {
+    "plans": "SELECT id, " + ", ".join(PLAN_COLUMNS) + ", created_at FROM plans ORDER BY id",
+    "reports": """SELECT r.id, r.plan_id, p.filename AS plan_filename, r.report_date, r.meters_built, r.worker_name, r.note
+                  FROM progress_reports r LEFT JOIN plans p ON r.plan_id = p.id ORDER BY r.id""",
+}
+
+
+def dump_table(table: str, path: str, chunk_rows: int = 10000) -> int:
+    """מייצא plans / reports ל-CSV או JSONL בהזרמה (fetchmany)"""
+    conn = get_db_connection()
+    try:
+        cur = conn.execute(DUMP_QUERIES[table])
+        columns = [d[0] for d in cur.description]
+        jsonl = path.lower().endswith(".jsonl")
+        count = 0
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = None if jsonl else csv.writer(f)
+            if writer:
+                writer.writerow(columns)
+            while True:
+                rows = cur.fetchmany(chunk_rows)
+                if not rows:
+                    break
+                if writer:
+                    writer.writerows(tuple(r) for r in rows)
+                else:
+                    f.writelines(json.dumps(dict(zip(columns, r)), ensure_ascii=False) + "\n" for r in rows)
+                count += len(rows)
+        return count
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ייבוא / ייצוא מרוכז של תוכניות ודיווחים")
+    parser.add_argument("action", choices=["import", "dump"])
+    parser.add_argument("table", choices=["plans", "reports"])
+    parser.add_argument("path", help="קובץ CSV או JSONL")
+    parser.add_argument("--max-errors", type=int, default=1000)
+    args = parser.parse_args()
+
+    from database import init_database
+    init_database()
+    if args.action == "dump":
+        print(f"נכתבו {dump_table(args.table, args.path)} שורות ל-{args.path}")
+    else:
+        importer = import_plans if args.table == "plans" else import_reports
+        result = importer(args.path, max_errors=args.max_errors)
+        print(f"יובאו {result['imported']} שורות, {len(result['errors'])} שורות נדחו")
+        for line_no, reason in result["errors"][:20]:
+            print(f"  שורה {line_no}: {reason}")
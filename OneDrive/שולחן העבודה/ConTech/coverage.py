@@ -0,0 +1,177 @@
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import get_coverage, get_coverage_tiles, save_coverage_tiles, reset_coverage
+
+# גודל אריח במפת הכיסוי - נשמר לכל תוכנית, שינוי שלו מאפס את המפה
+COVERAGE_TILE_SIZE = 256
+# מרחק (בפיקסלים של התוכנית) שבו קו שסומן "תופס" את קו השלד של הקיר
+COVERAGE_TOLERANCE_PX = 15
+# אורך מקטע לאורך הקו שבו נבחר השלד הקרוב ביותר - מעל √2, המרווח בין פיקסלים של שלד אלכסוני,
+# כך שבכל מקטע יש פיקסל של הקיר המסומן עצמו
+COVERAGE_BIN_PX = 2
+
+Line = Tuple[Tuple[float, float], Tuple[float, float]]
+
+
+def _grid(shape, tile_size: int) -> Tuple[int, int]:
+    return math.ceil(shape[0] / tile_size), math.ceil(shape[1] / tile_size)
+
+
+def _tile_bounds(idx: int, shape, tile_size: int) -> Tuple[int, int, int, int]:
+    _, cols = _grid(shape, tile_size)
+    ty, tx = divmod(idx, cols)
+    y0, x0 = ty * tile_size, tx * tile_size
+    return y0, min(y0 + tile_size, shape[0]), x0, min(x0 + tile_size, shape[1])
+
+
+def _touched_tiles(lines: Sequence[Line], radius: int, shape, tile_size: int) -> Dict[int, List[Line]]:
+    """אריחים שהקווים (עם רדיוס הסבילות) עוברים בהם, וכל הקווים הרלוונטיים לכל אריח"""
+    rows, cols = _grid(shape, tile_size)
+    touched: Dict[int, List[Line]] = {}
+    for line in lines:
+        (x1, y1), (x2, y2) = line
+        tx0 = max(0, int((min(x1, x2) - radius) // tile_size))
+        tx1 = min(cols - 1, int((max(x1, x2) + radius) // tile_size))
+        ty0 = max(0, int((min(y1, y2) - radius) // tile_size))
+        ty1 = min(rows - 1, int((max(y1, y2) + radius) // tile_size))
+        for ty in range(ty0, ty1 + 1):
+            for tx in range(tx0, tx1 + 1):
+                touched.setdefault(ty * cols + tx, []).append(line)
+    return touched
+
+
+def _claimed_pixels(skel_tile: np.ndarray, tile_lines: Sequence[Line], x0: int, y0: int, radius: int) -> np.ndarray:
+    """
+    פיקסלי השלד שהקווים תופסים: עד radius מהקו ובתוך ההיטל שלו (בלי "כיפות" מעבר לקצוות),
+    ובכל מקטע של COVERAGE_BIN_PX לאורך הקו רק השלד הקרוב ביותר אליו - כך שקיר ניצב שחוצה את הקו לא נתפס
+    """
+    ys, xs = np.nonzero(skel_tile)
+    claimed = np.zeros(len(ys), bool)
+    for (ax, ay), (bx, by) in tile_lines:
+        length = math.hypot(bx - ax, by - ay)
+        if length == 0:
+            continue
+        ux, uy = (bx - ax) / length, (by - ay) / length
+        rx, ry = xs + x0 - ax, ys + y0 - ay
+        along = rx * ux + ry * uy
+        dist = np.abs(rx * uy - ry * ux)
+        near = np.flatnonzero((along >= 0) & (along <= length) & (dist <= radius))
+        if not len(near):
+            continue
+        bins = (along[near] // COVERAGE_BIN_PX).astype(np.int64)
+        nearest = np.full(int(length // COVERAGE_BIN_PX) + 1, np.inf)
+        np.minimum.at(nearest, bins, dist[near])
+        # עד פיקסל מהקרוב ביותר - מדרגות של שלד אלכסוני נשארות, קיר ניצב נופל
+        claimed[near[dist[near] <= nearest[bins] + 1]] = True
+    hit = np.zeros(skel_tile.shape, bool)
+    hit[ys[claimed], xs[claimed]] = True
+    return hit
+
+
+def _unpack_tile(bits: bytes, h: int, w: int) -> np.ndarray:
+    return np.unpackbits(np.frombuffer(bits, dtype=np.uint8), count=h * w).reshape(h, w).astype(bool)
+
+
+def merge_report_coverage(conn, plan_id: int, skeleton: np.ndarray, lines: Sequence[Line],
+                          radius: int = COVERAGE_TOLERANCE_PX, tile_size: int = COVERAGE_TILE_SIZE) -> int:
+    """
+    מאחד את הקווים של דיווח אחד לתוך מפת הכיסוי של התוכנית
+    conn: טרנזקציה פתוחה (BEGIN IMMEDIATE) - קריאה, איחוד וכתיבה באותה טרנזקציה,
+    כך ששני דיווחים על אותו אריח לא דורסים זה את זה
+    lines: קווים בקואורדינטות של תמונת הניתוח (כמו השלד)
+    רק אריחים שהקווים עוברים בהם נקראים ונכתבים - עלות ביחס לקו, לא לגיליון
+    מחזירה: מספר פיקסלי שלד שכוסו לראשונה בדיווח הזה
+    """
+    shape = skeleton.shape[:2]
+    current = get_coverage(plan_id, conn=conn)
+    if current and (current["height"], current["width"], current["tile_size"]) != (shape[0], shape[1], tile_size):
+        # התוכנית נותחה מחדש בגודל אחר - מפת הכיסוי הישנה לא תואמת
+        reset_coverage(plan_id, conn=conn)
+
+    touched = _touched_tiles(lines, radius, shape, tile_size)
+    if not touched:
+        return 0
+    existing = get_coverage_tiles(plan_id, list(touched), conn=conn)
+
+    updates, delta = [], 0
+    for idx, tile_lines in touched.items():
+        y0, y1, x0, x1 = _tile_bounds(idx, shape, tile_size)
+        skel_tile = skeleton[y0:y1, x0:x1] > 0
+        if not skel_tile.any():
+            continue
+        hit = _claimed_pixels(skel_tile, tile_lines, x0, y0, radius)
+        old = existing.get(idx)
+        covered = hit | _unpack_tile(old["bits"], y1 - y0, x1 - x0) if old else hit
+        covered_count = int(covered.sum())
+        old_count = old["covered_pixels"] if old else 0
+        if covered_count == old_count:
+            continue
+        delta += covered_count - old_count
+        updates.append((idx, np.packbits(covered).tobytes(), covered_count, int(skel_tile.sum())))
+
+    if updates:
+        save_coverage_tiles(plan_id, shape[0], shape[1], tile_size, updates, delta, conn=conn)
+    return delta
+
+
+def add_report_coverage(plan_id: int, skeleton: np.ndarray, lines: Sequence[Line], report_id: Optional[int] = None,
+                        radius: int = COVERAGE_TOLERANCE_PX, tile_size: int = COVERAGE_TILE_SIZE) -> int:
+    """
+    merge_report_coverage דרך הכותב היחיד (ingest) - ממתינה ל-COMMIT
+    report_id: הדיווח מסומן כמאוחד למפה, והמטרים שלו לא נספרים בנפרד
+    """
+    from ingest import submit
+
+    def op(conn):
+        delta = merge_report_coverage(conn, plan_id, skeleton, lines, radius, tile_size)
+        if report_id is not None:
+            conn.execute("UPDATE progress_reports SET on_coverage = 1 WHERE id = ?", (report_id,))
+        return delta
+
+    return submit(op).result()
+
+
+def coverage_meters(plan_id: int, scale: float) -> float:
+    """מטרים שבוצעו בפועל (ללא ספירה כפולה של אותו קיר)"""
+    cov = get_coverage(plan_id)
+    return cov["covered_pixels"] / scale if cov and scale > 0 else 0.0
+
+
+def coverage_heatmap(plan_id: int, skeleton: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+    """
+    מפת חום של התקדמות - שיעור הכיסוי בכל אריח (NaN היכן שאין קירות ידועים)
+    בלי skeleton - מחושבת רק מהאריחים השמורים במסד
+    """
+    cov = get_coverage(plan_id)
+    if not cov:
+        return None
+    shape, tile_size = (cov["height"], cov["width"]), cov["tile_size"]
+    rows, cols = _grid(shape, tile_size)
+    covered = np.zeros(rows * cols)
+    totals = np.zeros(rows * cols)
+    if skeleton is not None:
+        for idx in range(rows * cols):
+            y0, y1, x0, x1 = _tile_bounds(idx, shape, tile_size)
+            totals[idx] = np.count_nonzero(skeleton[y0:y1, x0:x1])
+    for idx, tile in get_coverage_tiles(plan_id).items():
+        covered[idx] = tile["covered_pixels"]
+        totals[idx] = tile["total_pixels"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        heat = np.where(totals > 0, covered / totals, np.nan)
+    return heat.reshape(rows, cols)
+
+
+def coverage_mask(plan_id: int) -> Optional[np.ndarray]:
+    """מסכת הקירות שבוצעו במלואה (לתצוגה)"""
+    cov = get_coverage(plan_id)
+    if not cov:
+        return None
+    shape, tile_size = (cov["height"], cov["width"]), cov["tile_size"]
+    mask = np.zeros(shape, np.uint8)
+    for idx, tile in get_coverage_tiles(plan_id).items():
+        y0, y1, x0, x1 = _tile_bounds(idx, shape, tile_size)
+        mask[y0:y1, x0:x1] = _unpack_tile(tile["bits"], y1 - y0, x1 - x0) * 255
+    return mask
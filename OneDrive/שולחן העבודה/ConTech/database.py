@@ -1,8 +1,100 @@
 import sqlite3
 import json
+import queue
 from datetime import datetime
+import db_metrics
 
 DB_NAME = "contech.db"
+# מספר חיבורים פתוחים שנשמרים לשימוש חוזר (לכל תהליך)
+POOL_SIZE = 8
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+class _PooledConnection(sqlite3.Connection):
+    """חיבור שחוזר למאגר ב-close() במקום להיסגר"""
+    db_name = None
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+        if self.db_name == DB_NAME:
+            try:
+                _pool.put_nowait(self)
+                return
+            except queue.Full:
+                pass
+        super().close()
+
+class _InstrumentedConnection(db_metrics.InstrumentedConnectionMixin, _PooledConnection):
+    """חיבור עם מדידת שאילתות - בשימוש רק כשהמדידה מופעלת (בלי תקורה כשהיא כבויה)"""
+
+# אינדקסים משניים (שם -> DDL). ב-bulk import הם מוסרים לפני הטעינה ונבנים מחדש בסופה
+INDEXES = {
+    "idx_reports_plan_date": "CREATE INDEX IF NOT EXISTS idx_reports_plan_date ON progress_reports(plan_id, report_date, meters_built)",
+    "idx_reports_date": "CREATE INDEX IF NOT EXISTS idx_reports_date ON progress_reports(report_date, id)",
+    "idx_revisions_shape": "CREATE INDEX IF NOT EXISTS idx_revisions_shape ON plan_revisions(height, width)",
+    "idx_revisions_filename": "CREATE INDEX IF NOT EXISTS idx_revisions_filename ON plan_revisions(filename, id)",
+    "idx_revision_tiles_hash": "CREATE INDEX IF NOT EXISTS idx_revision_tiles_hash ON revision_tiles(tile_hash, revision_id)",
+}
+
+def create_indexes(conn, names=None):
+    for name in (names or INDEXES):
+        conn.execute(INDEXES[name])
+
+def drop_indexes(conn, names):
+    for name in names:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+# כל שינוי בטבלאות האלה מקדם את מונה הגרסה - מפתח לפסילת מטמון שאילתות באפליקציה
+VERSIONED_TABLES = ["plans", "progress_reports", "plan_coverage", "plan_revisions"]
+
+# מונה נפרד לאינדקס טביעות הפריסה: מתקדם רק כשקבוצת התוכניות המכוילות וטביעותיהן משתנה
+# (לא בכל העלאה של תוכנית חדשה ולא בכל דיווח) - (טבלה, פעולה): תנאי WHEN
+FINGERPRINT_TRIGGERS = {
+    ("plans", "INSERT"): "NEW.confirmed_scale > 0",
+    ("plans", "UPDATE"): ("OLD.confirmed_scale IS NOT NEW.confirmed_scale OR OLD.filename IS NOT NEW.filename "
+                          "OR OLD.plan_name IS NOT NEW.plan_name"),
+    ("plans", "DELETE"): "OLD.confirmed_scale > 0",
+    ("plan_revisions", "INSERT"): ("NEW.fingerprint IS NOT NULL AND EXISTS "
+                                   "(SELECT 1 FROM plans WHERE filename = NEW.filename AND confirmed_scale > 0)"),
+    ("plan_revisions", "DELETE"): "OLD.fingerprint IS NOT NULL",
+}
+
+def create_version_triggers(conn, tables=None):
+    for table in (tables or VERSIONED_TABLES):
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{op.lower()}_version AFTER {op} ON {table}
+                BEGIN UPDATE data_version SET version = version + 1 WHERE id = 1; END''')
+            when = FINGERPRINT_TRIGGERS.get((table, op))
+            if when:
+                conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{op.lower()}_fingerprints AFTER {op} ON {table}
+                    WHEN {when}
+                    BEGIN UPDATE fingerprint_version SET version = version + 1 WHERE id = 1; END''')
+
+def drop_version_triggers(conn, tables):
+    """ב-bulk import הטריגרים מוסרים (טריגר לכל שורה) והגרסה מקודמת פעם אחת בסוף"""
+    for table in tables:
+        for op in ("insert", "update", "delete"):
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_{op}_version")
+            conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_{op}_fingerprints")
+
+def bump_data_version(conn):
+    conn.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+    conn.execute("UPDATE fingerprint_version SET version = version + 1 WHERE id = 1")
+
+def get_data_version():
+    """מונה שמתקדם בכל שינוי בתוכניות, בדיווחים ובכיסוי (גם מתהליכים אחרים)"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+def get_fingerprint_version():
+    """מונה שמתקדם רק כשטביעות הפריסה של התוכניות המכוילות משתנות"""
+    conn = get_db_connection()
+    row = conn.execute("SELECT version FROM fingerprint_version WHERE id = 1").fetchone()
+    conn.close()
+    return row[0] if row else 0
 
 def init_database():
     conn = sqlite3.connect(DB_NAME)
@@ -30,27 +122,123 @@ def init_database():
         meters_built REAL,
         worker_name TEXT,
         note TEXT,
+        on_coverage INTEGER DEFAULT 0,
         FOREIGN KEY(plan_id) REFERENCES plans(id)
     )''')
+    # מסדים ישנים: on_coverage = 1 לדיווח שהקווים שלו אוחדו למפת הכיסוי
+    if "on_coverage" not in {row[1] for row in c.execute("PRAGMA table_info(progress_reports)")}:
+        c.execute("ALTER TABLE progress_reports ADD COLUMN on_coverage INTEGER DEFAULT 0")
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS plan_revisions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        filename TEXT,
+        plan_name TEXT,
+        name_key TEXT,
+        fingerprint TEXT,
+        height INTEGER,
+        width INTEGER,
+        tile_size INTEGER,
+        raw_pixel_count INTEGER,
+        cache_key TEXT,
+        parent_id INTEGER,
+        changed_tiles INTEGER,
+        total_tiles INTEGER,
+        content_aspect REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(parent_id) REFERENCES plan_revisions(id)
+    )''')
+    # מסדים ישנים: יחס רוחב/גובה של תחום הקירות, נבדק לפני התאמת טביעת פריסה
+    if "content_aspect" not in {row[1] for row in c.execute("PRAGMA table_info(plan_revisions)")}:
+        c.execute("ALTER TABLE plan_revisions ADD COLUMN content_aspect REAL")
+    # חתימות האריחים שיש בהם קירות, לכל גרסה - לזיהוי הגרסה הקודמת לפי אריחים זהים
+    c.execute('''CREATE TABLE IF NOT EXISTS revision_tiles (
+        revision_id INTEGER,
+        tile_hash TEXT,
+        PRIMARY KEY(revision_id, tile_hash),
+        FOREIGN KEY(revision_id) REFERENCES plan_revisions(id)
+    )''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS plan_coverage (
+        plan_id INTEGER PRIMARY KEY,
+        height INTEGER,
+        width INTEGER,
+        tile_size INTEGER,
+        covered_pixels INTEGER DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(plan_id) REFERENCES plans(id)
+    )''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS coverage_tiles (
+        plan_id INTEGER,
+        tile_idx INTEGER,
+        bits BLOB,
+        covered_pixels INTEGER,
+        total_pixels INTEGER,
+        PRIMARY KEY(plan_id, tile_idx),
+        FOREIGN KEY(plan_id) REFERENCES plans(id)
+    )''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS analysis_jobs (
+        id TEXT PRIMARY KEY,
+        filename TEXT,
+        status TEXT,
+        result_json TEXT,
+        error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    
+    c.execute('''CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )''')
+    c.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+    c.execute('''CREATE TABLE IF NOT EXISTS fingerprint_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )''')
+    c.execute("INSERT OR IGNORE INTO fingerprint_version (id, version) VALUES (1, 0)")
+    
+    create_indexes(conn)
+    create_version_triggers(conn)
     
     conn.commit()
     conn.close()
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+    factory = _InstrumentedConnection if db_metrics.enabled() else _PooledConnection
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            break
+        if conn.db_name == DB_NAME and type(conn) is factory:
+            return conn
+        sqlite3.Connection.close(conn)
+    conn = sqlite3.connect(DB_NAME, factory=factory, check_same_thread=False, timeout=30)
+    conn.db_name = DB_NAME
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
     return conn
 
 def save_plan(filename, plan_name, extracted_scale, confirmed_scale, raw_pixel_count, metadata_json, target_date=None, budget_limit=0, cost_per_meter=0, material_estimate="{}"):
     conn = get_db_connection()
     c = conn.cursor()
     try:
-        c.execute('''INSERT OR REPLACE INTO plans 
+        # upsert אמיתי - INSERT OR REPLACE מוחק את השורה ונותן לתוכנית id חדש (והדיווחים נשארים יתומים)
+        c.execute('''INSERT INTO plans 
             (filename, plan_name, extracted_scale, confirmed_scale, raw_pixel_count, metadata_json, target_date, budget_limit, cost_per_meter, material_estimate)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(filename) DO UPDATE SET
+                plan_name = excluded.plan_name, extracted_scale = excluded.extracted_scale,
+                confirmed_scale = excluded.confirmed_scale, raw_pixel_count = excluded.raw_pixel_count,
+                metadata_json = excluded.metadata_json, target_date = excluded.target_date,
+                budget_limit = excluded.budget_limit, cost_per_meter = excluded.cost_per_meter,
+                material_estimate = excluded.material_estimate''',
             (filename, plan_name, extracted_scale, confirmed_scale, raw_pixel_count, metadata_json, target_date, budget_limit, cost_per_meter, material_estimate))
+        plan_id = c.execute("SELECT id FROM plans WHERE filename = ?", (filename,)).fetchone()[0]
         conn.commit()
-        return c.lastrowid
+        return plan_id
     finally:
         conn.close()
 
@@ -70,6 +258,21 @@ def get_all_plans():
     conn.close()
     return [dict(p) for p in plans]
 
+def iter_plans(plan_ids=None):
+    """מחזיר את התוכניות אחת-אחת (generator) בלי לטעון את כולן לזיכרון"""
+    conn = get_db_connection()
+    try:
+        query = "SELECT * FROM plans"
+        params = []
+        if plan_ids:
+            query += f" WHERE id IN ({','.join('?' * len(plan_ids))})"
+            params.extend(plan_ids)
+        query += " ORDER BY id"
+        for row in conn.execute(query, params):
+            yield dict(row)
+    finally:
+        conn.close()
+
 def get_plan_by_filename(filename):
     conn = get_db_connection()
     plan = conn.execute("SELECT * FROM plans WHERE filename = ?", (filename,)).fetchone()
@@ -82,6 +285,102 @@ def get_plan_by_id(plan_id):
     conn.close()
     return dict(plan) if plan else None
 
+def save_plan_revision(filename, plan_name, name_key, fingerprint, height, width, tile_size,
+                       raw_pixel_count, cache_key, parent_id=None, changed_tiles=0, total_tiles=0, tile_hashes=(),
+                       content_aspect=None):
+    conn = get_db_connection()
+    c = conn.cursor()
+    try:
+        c.execute('''INSERT INTO plan_revisions
+            (filename, plan_name, name_key, fingerprint, height, width, tile_size, raw_pixel_count, cache_key, parent_id,
+             changed_tiles, total_tiles, content_aspect)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            (filename, plan_name, name_key, fingerprint, height, width, tile_size, raw_pixel_count, cache_key, parent_id,
+             changed_tiles, total_tiles, content_aspect))
+        revision_id = c.lastrowid
+        c.executemany("INSERT OR IGNORE INTO revision_tiles (revision_id, tile_hash) VALUES (?, ?)",
+                      [(revision_id, h) for h in tile_hashes])
+        conn.commit()
+        return revision_id
+    finally:
+        conn.close()
+
+def get_revision_candidates(height, width, tile_size, tile_hashes):
+    """
+    גרסאות באותו גודל שחולקות לפחות אריח זהה אחד (לפי חתימות האריחים שיש בהם קירות)
+    מחזירה: רשומות plan_revisions עם shared_tiles (אריחים זהים) ו-content_tiles (אריחים עם קירות בגרסה)
+    """
+    if not tile_hashes:
+        return []
+    conn = get_db_connection()
+    placeholders = ",".join("?" * len(tile_hashes))
+    rows = conn.execute(f"""
+        SELECT r.*, m.shared_tiles,
+               (SELECT COUNT(*) FROM revision_tiles WHERE revision_id = r.id) AS content_tiles
+        FROM (SELECT revision_id, COUNT(*) AS shared_tiles FROM revision_tiles
+              WHERE tile_hash IN ({placeholders}) GROUP BY revision_id) m
+        JOIN plan_revisions r ON r.id = m.revision_id
+        WHERE r.height = ? AND r.width = ? AND r.tile_size = ?
+        ORDER BY m.shared_tiles DESC, r.id DESC
+    """, (*tile_hashes, height, width, tile_size)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def get_latest_revision(filename):
+    conn = get_db_connection()
+    rev = conn.execute("SELECT * FROM plan_revisions WHERE filename = ? ORDER BY id DESC LIMIT 1", (filename,)).fetchone()
+    conn.close()
+    return dict(rev) if rev else None
+
+def get_plan_fingerprints():
+    """
+    טביעת הפריסה (מהגרסה האחרונה) של כל תוכנית מכוילת - לאינדקס הדמיון החזותי
+    גרסאות בלי content_aspect נשמרו עם הטביעה הישנה (64 ביט) ואינן ברות השוואה
+    """
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT p.id, p.plan_name, p.filename, p.confirmed_scale, r.fingerprint, r.content_aspect, r.width, r.height
+        FROM plans p
+        JOIN plan_revisions r ON r.id = (SELECT MAX(id) FROM plan_revisions WHERE filename = p.filename)
+        WHERE p.confirmed_scale > 0 AND r.fingerprint IS NOT NULL AND r.content_aspect IS NOT NULL
+    """).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def get_plan_revisions(name_key):
+    conn = get_db_connection()
+    rows = conn.execute("SELECT * FROM plan_revisions WHERE name_key = ? ORDER BY id", (name_key,)).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def create_job(job_id, filename):
+    conn = get_db_connection()
+    try:
+        conn.execute("INSERT INTO analysis_jobs (id, filename, status) VALUES (?, ?, 'queued')", (job_id, filename))
+        conn.commit()
+    finally:
+        conn.close()
+
+def update_job(job_id, status, result=None, error=None):
+    conn = get_db_connection()
+    try:
+        conn.execute("""UPDATE analysis_jobs SET status = ?, result_json = ?, error = ?, updated_at = CURRENT_TIMESTAMP
+                        WHERE id = ?""",
+                     (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, job_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+def get_job(job_id):
+    conn = get_db_connection()
+    job = conn.execute("SELECT * FROM analysis_jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    if not job:
+        return None
+    job = dict(job)
+    job['result'] = json.loads(job.pop('result_json')) if job.get('result_json') else None
+    return job
+
 def get_progress_reports(plan_id=None):
     conn = get_db_connection()
     query = """
@@ -99,45 +398,225 @@ def get_progress_reports(plan_id=None):
     reports = conn.execute(query, params).fetchall()
     conn.close()
     
-    results = []
-    for r in reports:
-        row = dict(r)
+    return [_format_report_row(r) for r in reports]
+
+def _format_report_row(r):
+    row = dict(r)
+    try:
+        dt = datetime.fromisoformat(row['report_date'])
+    except:
         try:
-            dt = datetime.fromisoformat(row['report_date'])
+            dt = datetime.strptime(row['report_date'], "%Y-%m-%d %H:%M:%S")
         except:
-            try:
-                dt = datetime.strptime(row['report_date'], "%Y-%m-%d %H:%M:%S")
-            except:
-                dt = row['report_date']
-        
-        if isinstance(dt, datetime):
-            row['date'] = dt.strftime("%d/%m/%Y %H:%M")
-        else:
-            row['date'] = str(dt)
-            
-        results.append(row)
-    return results
+            dt = row['report_date']
+    
+    if isinstance(dt, datetime):
+        row['date'] = dt.strftime("%d/%m/%Y %H:%M")
+    else:
+        row['date'] = str(dt)
+    return row
+
+# ביטוי SQL לתחילת כל דלי זמן
+TIME_BUCKETS = {
+    "day": "date(report_date)",
+    "week": "date(report_date, 'weekday 0', '-6 days')",
+    "month": "strftime('%Y-%m-01', report_date)",
+}
 
-def calculate_material_estimates(total_length_meters, wall_height_meters=2.5):
-    total_area = total_length_meters * wall_height_meters
-    blocks_per_sqm = 10 
-    blocks = total_area * blocks_per_sqm * 1.05
-    mortar_volume = total_area * 0.02
-    cement = mortar_volume * 0.3
-    sand = mortar_volume * 0.7
+def get_progress_timeseries(plan_id=None, bucket="day", max_points=None):
+    """
+    סדרת זמן של התקדמות (תוכנית אחת או כל הפורטפוליו) - מקובצת ומסוכמת ב-SQL
+    bucket: day / week / month
+    max_points: אם יש יותר דליים - דליים סמוכים מאוחדים כך שיוחזרו לכל היותר max_points נקודות
+    מחזירה: [{"bucket", "meters", "reports", "cumulative"}]
+    """
+    if bucket not in TIME_BUCKETS:
+        raise ValueError(f"bucket לא נתמך: {bucket}")
+    where, params = "", []
+    if plan_id:
+        where = "WHERE plan_id = ?"
+        params.append(plan_id)
     
-    return {
-        "wall_area_sqm": total_area,
-        "block_count": int(blocks),
-        "cement_cubic_meters": cement,
-        "sand_cubic_meters": sand
+    base = f"""
+        SELECT {TIME_BUCKETS[bucket]} AS bucket, SUM(meters_built) AS meters, COUNT(*) AS reports
+        FROM progress_reports {where}
+        GROUP BY 1
+    """
+    if max_points:
+        query = f"""
+            WITH b AS ({base}),
+            n AS (
+                SELECT bucket, meters, reports,
+                       ROW_NUMBER() OVER (ORDER BY bucket) - 1 AS rn,
+                       COUNT(*) OVER () AS cnt
+                FROM b
+            ),
+            g AS (
+                SELECT MIN(bucket) AS bucket, SUM(meters) AS meters, SUM(reports) AS reports
+                FROM n GROUP BY rn / ((cnt + ? - 1) / ?)
+            )
+            SELECT bucket, meters, reports, SUM(meters) OVER (ORDER BY bucket) AS cumulative
+            FROM g ORDER BY bucket
+        """
+        params += [int(max_points), int(max_points)]
+    else:
+        query = f"""
+            WITH b AS ({base})
+            SELECT bucket, meters, reports, SUM(meters) OVER (ORDER BY bucket) AS cumulative
+            FROM b ORDER BY bucket
+        """
+    
+    conn = get_db_connection()
+    rows = conn.execute(query, params).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def get_progress_reports_page(plan_id=None, limit=50, cursor=None):
+    """
+    עימוד דיווחים מהחדש לישן לפי cursor (keyset) - בלי OFFSET, עלות קבועה לכל עמוד
+    cursor: הערך next_cursor שהוחזר מהעמוד הקודם (None לעמוד הראשון)
+    מחזירה: (דיווחים, next_cursor או None אם זה העמוד האחרון)
+    """
+    query = """
+        SELECT r.*, p.plan_name 
+        FROM progress_reports r
+        JOIN plans p ON r.plan_id = p.id
+    """
+    conditions, params = [], []
+    if plan_id:
+        conditions.append("r.plan_id = ?")
+        params.append(plan_id)
+    if cursor:
+        last_date, last_id = cursor.rsplit("|", 1)
+        conditions.append("(r.report_date < ? OR (r.report_date = ? AND r.id < ?))")
+        params += [last_date, last_date, int(last_id)]
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY r.report_date DESC, r.id DESC LIMIT ?"
+    params.append(int(limit) + 1)
+    
+    conn = get_db_connection()
+    reports = conn.execute(query, params).fetchall()
+    conn.close()
+    
+    page = [_format_report_row(r) for r in reports[:limit]]
+    next_cursor = None
+    if len(reports) > limit:
+        last = page[-1]
+        next_cursor = f"{last['report_date']}|{last['id']}"
+    return page, next_cursor
+
+def calculate_material_estimates(total_length_meters, wall_height_meters=2.5, thickness_hist=None, scale=None):
+    from estimates import aggregate_by_type, estimate_materials_batch, estimate_materials_by_thickness
+    result = estimate_materials_batch(total_length_meters, wall_height_meters)
+    estimate = {
+        "wall_area_sqm": float(result["wall_area_sqm"]),
+        "block_count": int(result["block_count"]),
+        "cement_cubic_meters": float(result["cement_cubic_meters"]),
+        "sand_cubic_meters": float(result["sand_cubic_meters"]),
+        "basis": "standard"
     }
+    if thickness_hist is not None and scale:
+        # פירוט לפי עובי קיר (בלוק 10 / 15 / 20) - והסכום הכולל נגזר ממנו, לא מהבלוק הסטנדרטי
+        estimate["by_block_type"] = estimate_materials_by_thickness(thickness_hist, scale, wall_height_meters)
+        total = aggregate_by_type(estimate["by_block_type"])
+        if total:
+            estimate.update(total, basis="by_thickness")
+    return estimate
+
+def get_plan_wall_lengths():
+    """אורך קירות (מטר) לכל תוכנית מכוילת - לחישובי תרחישים"""
+    conn = get_db_connection()
+    rows = conn.execute("""
+        SELECT id, plan_name, raw_pixel_count / confirmed_scale AS wall_length_m
+        FROM plans WHERE confirmed_scale > 0 ORDER BY id
+    """).fetchall()
+    conn.close()
+    return [dict(r) for r in rows]
+
+def get_coverage(plan_id, conn=None):
+    """conn: חיבור של טרנזקציה פתוחה (למשל פעולה בתור של ingest) - לא נסגר כאן"""
+    own = conn is None
+    conn = conn or get_db_connection()
+    row = conn.execute("SELECT * FROM plan_coverage WHERE plan_id = ?", (plan_id,)).fetchone()
+    if own: conn.close()
+    return dict(row) if row else None
+
+def get_coverage_tiles(plan_id, tile_ids=None, conn=None):
+    own = conn is None
+    conn = conn or get_db_connection()
+    query = "SELECT * FROM coverage_tiles WHERE plan_id = ?"
+    params = [plan_id]
+    if tile_ids is not None:
+        query += f" AND tile_idx IN ({','.join('?' * len(tile_ids))})"
+        params.extend(tile_ids)
+    rows = conn.execute(query, params).fetchall()
+    if own: conn.close()
+    return {r['tile_idx']: dict(r) for r in rows}
+
+def save_coverage_tiles(plan_id, height, width, tile_size, tiles, delta_pixels, conn=None):
+    """
+    שומר אריחי כיסוי שהשתנו ומעדכן את סך הפיקסלים המכוסים - בטרנזקציה אחת
+    tiles: [(tile_idx, bits, covered_pixels, total_pixels)]
+    conn: טרנזקציה של הקורא - בלי commit כאן
+    """
+    own = conn is None
+    conn = conn or get_db_connection()
+    try:
+        conn.execute('''INSERT INTO plan_coverage (plan_id, height, width, tile_size, covered_pixels)
+            VALUES (?, ?, ?, ?, 0)
+            ON CONFLICT(plan_id) DO NOTHING''', (plan_id, height, width, tile_size))
+        conn.executemany('''INSERT INTO coverage_tiles (plan_id, tile_idx, bits, covered_pixels, total_pixels)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(plan_id, tile_idx) DO UPDATE SET bits = excluded.bits, covered_pixels = excluded.covered_pixels''',
+            [(plan_id, idx, bits, covered, total) for idx, bits, covered, total in tiles])
+        conn.execute("UPDATE plan_coverage SET covered_pixels = covered_pixels + ?, updated_at = CURRENT_TIMESTAMP WHERE plan_id = ?",
+                     (delta_pixels, plan_id))
+        if own: conn.commit()
+    finally:
+        if own: conn.close()
+
+def reset_coverage(plan_id, conn=None):
+    """מוחק את מפת הכיסוי; הדיווחים שאוחדו אליה נספרים שוב לפי המטרים שלהם"""
+    own = conn is None
+    conn = conn or get_db_connection()
+    conn.execute("DELETE FROM coverage_tiles WHERE plan_id = ?", (plan_id,))
+    conn.execute("DELETE FROM plan_coverage WHERE plan_id = ?", (plan_id,))
+    conn.execute("UPDATE progress_reports SET on_coverage = 0 WHERE plan_id = ?", (plan_id,))
+    if own:
+        conn.commit()
+        conn.close()
+
+def _report_totals(plan_id):
+    """סיכום הדיווחים של תוכנית ב-SQL - בלי לטעון ולעבור על כל ההיסטוריה"""
+    conn = get_db_connection()
+    row = conn.execute("""
+        SELECT COUNT(*) AS reports,
+               COALESCE(SUM(meters_built), 0) AS meters,
+               COALESCE(SUM(CASE WHEN on_coverage THEN 0 ELSE meters_built END), 0) AS unmapped_meters,
+               MIN(report_date) AS first_date, MAX(report_date) AS last_date
+        FROM progress_reports WHERE plan_id = ?
+    """, (plan_id,)).fetchone()
+    conn.close()
+    return dict(row)
+
+def _built_meters(plan_id, totals, confirmed_scale):
+    """
+    מטרים שבוצעו: מפת הכיסוי (ללא כפילויות) לדיווחים שסומנו עליה,
+    ועוד סכום המטרים של דיווחים שלא אוחדו למפה (דיווחים ישנים, API, ייבוא)
+    totals: מ-_report_totals
+    """
+    if confirmed_scale <= 0:
+        # בלי קנה מידה אין המרה של המפה למטרים - סכום כל הדיווחים
+        return float(totals['meters'])
+    coverage = get_coverage(plan_id)
+    return (coverage['covered_pixels'] / confirmed_scale if coverage else 0.0) + float(totals['unmapped_meters'])
 
 def get_project_forecast(plan_id):
     plan = get_plan_by_id(plan_id)
     if not plan: return {}
     
-    reports = get_progress_reports(plan_id)
+    totals = _report_totals(plan_id)
     
     try: confirmed_scale = float(plan.get('confirmed_scale', 0))
     except: confirmed_scale = 0.0
@@ -149,14 +628,14 @@ def get_project_forecast(plan_id):
     if confirmed_scale > 0:
         total_planned_meters = raw_pixels / confirmed_scale
         
-    cumulative = sum([float(r['meters_built']) for r in reports])
+    cumulative = _built_meters(plan_id, totals, confirmed_scale)
     
     days_passed = 0
     velocity = 0
-    if reports:
+    if totals['reports']:
         try:
-            first = reports[-1]['report_date']
-            last = reports[0]['report_date']
+            first = totals['first_date']
+            last = totals['last_date']
             # ניקוי פורמט תאריך למקרה שיש מילישניות
             d1_str = str(first).split('.')[0]
             d2_str = str(last).split('.')[0]
@@ -185,8 +664,11 @@ def get_project_financial_status(plan_id):
     plan = get_plan_by_id(plan_id)
     if not plan: return {}
     
-    reports = get_progress_reports(plan_id)
-    cumulative_meters = sum([float(r['meters_built']) for r in reports])
+    totals = _report_totals(plan_id)
+    
+    try: confirmed_scale = float(plan.get('confirmed_scale', 0))
+    except: confirmed_scale = 0.0
+    cumulative_meters = _built_meters(plan_id, totals, confirmed_scale)
     
     try:
         cost_per_meter = float(plan.get('cost_per_meter', 0))
@@ -207,9 +689,17 @@ def get_project_financial_status(plan_id):
 def reset_all_data():
     conn = get_db_connection()
     c = conn.cursor()
+    # בלי טריגרים DELETE מלא הוא truncate מהיר; הגרסה מקודמת פעם אחת
+    drop_version_triggers(conn, VERSIONED_TABLES)
     c.execute("DELETE FROM progress_reports")
+    c.execute("DELETE FROM coverage_tiles")
+    c.execute("DELETE FROM plan_coverage")
+    c.execute("DELETE FROM revision_tiles")
+    c.execute("DELETE FROM plan_revisions")
     c.execute("DELETE FROM plans")
     c.execute("DELETE FROM sqlite_sequence")
+    create_version_triggers(conn)
+    bump_data_version(conn)
     conn.commit()
     conn.close()
     return True
\ No newline at end of file
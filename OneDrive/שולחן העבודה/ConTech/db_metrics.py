@@ -0,0 +1,280 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger("contech.db")
+
+# גבולות ההיסטוגרמה (שניות) - כמו ב-Prometheus, כל תא מצטבר
+LATENCY_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+SLOW_LOG_SIZE = 200
+
+_enabled = os.environ.get("CONTECH_DB_METRICS", "") not in ("", "0")
+_slow_query_ms = float(os.environ.get("CONTECH_SLOW_QUERY_MS", 100))
+_lock = threading.Lock()
+_stats: Dict[tuple, Dict] = {}
+_slow: deque = deque(maxlen=SLOW_LOG_SIZE)
+_local = threading.local()
+_THIS_FILE = __file__
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(slow_query_ms: Optional[float] = None) -> None:
+    """הפעלה בזמן ריצה; חיבורים שכבר במאגר מוחלפים בקריאה הבאה ל-get_db_connection"""
+    global _enabled, _slow_query_ms
+    _enabled = True
+    if slow_query_ms is not None:
+        _slow_query_ms = float(slow_query_ms)
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def reset() -> None:
+    with _lock:
+        _stats.clear()
+        _slow.clear()
+
+
+_WS = re.compile(r"\s+")
+_normalized: Dict[str, str] = {}
+
+
+def _normalize(sql: str) -> str:
+    text = _normalized.get(sql)
+    if text is None:
+        text = _WS.sub(" ", sql).strip()
+        if len(_normalized) < 10000:
+            _normalized[sql] = text
+    return text
+
+
+def _query_id(sql: str) -> str:
+    return hashlib.blake2b(sql.encode("utf-8"), digest_size=4).hexdigest()
+
+
+def _caller():
+    """הפונקציה הראשונה מחוץ למודול הזה - תג השאילתה; plan_id נלקח מהמשתנים המקומיים שלה"""
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == _THIS_FILE:
+        frame = frame.f_back
+    if frame is None:
+        return "?", None
+    return frame.f_code.co_name, frame.f_locals.get("plan_id")
+
+
+def _record(sql: str, caller: str, plan_id, seconds: float, rows: int) -> None:
+    sql = _normalize(sql)
+    key = (caller, sql)
+    with _lock:
+        entry = _stats.get(key)
+        if entry is None:
+            entry = _stats[key] = {"caller": caller, "sql": sql, "query_id": _query_id(sql), "count": 0,
+                                   "seconds": 0.0, "max_seconds": 0.0, "rows": 0,
+                                   "buckets": [0] * len(LATENCY_BUCKETS)}
+        entry["count"] += 1
+        entry["seconds"] += seconds
+        entry["rows"] += rows
+        entry["max_seconds"] = max(entry["max_seconds"], seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):  # תאים מצטברים (le)
+            if seconds <= bound:
+                entry["buckets"][i] += 1
+    tracked = getattr(_local, "tracked", None)
+    if tracked is not None:
+        tracked.append({"caller": caller, "seconds": seconds, "rows": rows})
+    if seconds * 1000 >= _slow_query_ms:
+        record = {"at": time.strftime("%Y-%m-%d %H:%M:%S"), "caller": caller, "plan_id": plan_id,
+                  "ms": round(seconds * 1000, 2), "rows": rows, "sql": sql}
+        with _lock:
+            _slow.append(record)
+        logger.warning("slow query %.1f ms in %s (plan_id=%s, rows=%d): %s",
+                       seconds * 1000, caller, plan_id, rows, sql[:300])
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    מודד כל שאילתה מה-execute ועד שהתוצאה נקראה עד הסוף (או שהסמן נזנח),
+    כי ב-SQLite רוב העבודה של SELECT נעשית בזמן ה-fetch
+    """
+    _pending = None  # [sql, caller, plan_id, seconds, rows]
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            _record(*pending)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        caller, plan_id = _caller()
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._pending = [sql, caller, plan_id, time.perf_counter() - start, 0]
+        if self.description is None:
+            self._pending[4] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        caller, plan_id = _caller()
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._pending = [sql, caller, plan_id, time.perf_counter() - start, max(self.rowcount, 0)]
+            self._finish()
+        return self
+
+    def _timed(self, fetch, *args):
+        start = time.perf_counter()
+        result = fetch(*args)
+        if self._pending is not None:
+            self._pending[3] += time.perf_counter() - start
+        return result
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if self._pending is not None:
+            if row is None:
+                self._finish()
+            else:
+                self._pending[4] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if self._pending is not None:
+            self._pending[4] += len(rows)
+            if len(rows) < size:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending is not None:
+            self._pending[4] += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending is not None:
+            self._pending[4] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+
+class InstrumentedConnectionMixin:
+    """conn.execute() של sqlite3 לא עובר דרך cursor() - לכן שתיהן נדרסות"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def start_tracking() -> list:
+    """מתחיל לאסוף את השאילתות שרצות ב-thread הנוכחי (למשל ריצה אחת של עמוד)"""
+    _local.tracked = []
+    return _local.tracked
+
+
+def stop_tracking() -> list:
+    tracked, _local.tracked = getattr(_local, "tracked", None), None
+    return tracked or []
+
+
+@contextmanager
+def track_queries():
+    tracked = start_tracking()
+    try:
+        yield tracked
+    finally:
+        stop_tracking()
+
+
+def snapshot() -> Dict:
+    """כל המדדים כמבנה JSON"""
+    with _lock:
+        queries = [dict(e, buckets=dict(zip(map(str, LATENCY_BUCKETS), e["buckets"])))
+                   for e in _stats.values()]
+        slow = list(_slow)
+    queries.sort(key=lambda e: e["seconds"], reverse=True)
+    return {"enabled": _enabled, "slow_query_ms": _slow_query_ms, "queries": queries, "slow_queries": slow}
+
+
+def to_json() -> str:
+    return json.dumps(snapshot(), ensure_ascii=False)
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def to_prometheus() -> str:
+    """פורמט טקסט של Prometheus (text exposition 0.0.4)"""
+    with _lock:
+        entries = [dict(e, buckets=list(e["buckets"])) for e in _stats.values()]
+    lines = [
+        "# HELP contech_db_queries_total Queries executed, by calling function and query",
+        "# TYPE contech_db_queries_total counter",
+    ]
+    for e in entries:
+        lines.append(f'contech_db_queries_total{{caller="{_label(e["caller"])}",query="{e["query_id"]}"}} {e["count"]}')
+    lines += [
+        "# HELP contech_db_rows_total Rows returned or affected",
+        "# TYPE contech_db_rows_total counter",
+    ]
+    for e in entries:
+        lines.append(f'contech_db_rows_total{{caller="{_label(e["caller"])}",query="{e["query_id"]}"}} {e["rows"]}')
+    lines += [
+        "# HELP contech_db_query_seconds Query latency including result fetch",
+        "# TYPE contech_db_query_seconds histogram",
+    ]
+    for e in entries:
+        labels = f'caller="{_label(e["caller"])}",query="{e["query_id"]}"'
+        for bound, count in zip(LATENCY_BUCKETS, e["buckets"]):
+            lines.append(f'contech_db_query_seconds_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f'contech_db_query_seconds_bucket{{{labels},le="+Inf"}} {e["count"]}')
+        lines.append(f'contech_db_query_seconds_sum{{{labels}}} {e["seconds"]:.6f}')
+        lines.append(f'contech_db_query_seconds_count{{{labels}}} {e["count"]}')
+    lines += [
+        "# HELP contech_db_query_info SQL text of each query id",
+        "# TYPE contech_db_query_info gauge",
+    ]
+    for e in entries:
+        lines.append(f'contech_db_query_info{{query="{e["query_id"]}",sql="{_label(e["sql"][:200])}"}} 1')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,154 @@
+from itertools import product
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+ArrayLike = Union[float, Sequence[float], np.ndarray]
+
+# סוגי בלוקים: כמות למ"ר קיר ונפח מלט-חול (מ"ק) למ"ר קיר
+# standard - הערכה כללית כשאין פירוט עובי (בלי עובי משלו, כדי שלא יתחרה ב-block_20)
+BLOCK_TYPES = {
+    "standard": {"blocks_per_sqm": 10.0, "mortar_m3_per_sqm": 0.02},
+    "block_20": {"blocks_per_sqm": 12.5, "mortar_m3_per_sqm": 0.025, "thickness_cm": 20},
+    "block_15": {"blocks_per_sqm": 12.5, "mortar_m3_per_sqm": 0.019, "thickness_cm": 15},
+    "block_10": {"blocks_per_sqm": 12.5, "mortar_m3_per_sqm": 0.013, "thickness_cm": 10},
+}
+
+DEFAULT_SCENARIO = {
+    "wall_height": 2.5,
+    "block_type": "standard",
+    "waste_factor": 0.05,
+    "cement_ratio": 0.3,
+}
+
+# סיווג קירות לפי עובי (ס"מ): גבול עליון לכל סוג בלוק
+THICKNESS_CLASSES = [("block_10", 12.5), ("block_15", 17.5), ("block_20", float("inf"))]
+
+RESULT_COLUMNS = ["wall_area_sqm", "block_count", "cement_cubic_meters", "sand_cubic_meters"]
+
+
+def estimate_materials_batch(wall_lengths: ArrayLike, wall_heights: ArrayLike = 2.5,
+                             blocks_per_sqm: ArrayLike = 10.0, waste_factors: ArrayLike = 0.05,
+                             mortar_m3_per_sqm: ArrayLike = 0.02, cement_ratios: ArrayLike = 0.3) -> Dict[str, np.ndarray]:
+    """
+    הערכת חומרים וקטורית - כל הפרמטרים עוברים broadcasting של NumPy
+    לדוגמה: אורכים בצורה (P, 1) ותרחישים בצורה (1, S) -> תוצאות בצורה (P, S)
+    מחזירה: מילון של מערכים (wall_area_sqm, block_count, cement_cubic_meters, sand_cubic_meters)
+    """
+    lengths = np.asarray(wall_lengths, dtype=np.float64)
+    total_area = lengths * np.asarray(wall_heights, dtype=np.float64)
+    blocks = total_area * np.asarray(blocks_per_sqm, dtype=np.float64) * (1 + np.asarray(waste_factors, dtype=np.float64))
+    mortar_volume = total_area * np.asarray(mortar_m3_per_sqm, dtype=np.float64)
+    cement_ratios = np.asarray(cement_ratios, dtype=np.float64)
+    return {
+        "wall_area_sqm": total_area,
+        "block_count": np.trunc(blocks).astype(np.int64),
+        "cement_cubic_meters": mortar_volume * cement_ratios,
+        "sand_cubic_meters": mortar_volume * (1 - cement_ratios),
+    }
+
+
+def thickness_buckets(thickness_hist: Sequence[int], scale: float) -> Dict[str, float]:
+    """
+    אורך קירות (מטר) לכל סוג בלוק לפי היסטוגרמת העובי של השלד
+    thickness_hist: מספר פיקסלי שלד לכל עובי בפיקסלים (אינדקס = עובי)
+    scale: פיקסלים למטר
+    """
+    hist = np.asarray(thickness_hist, dtype=np.float64)
+    if scale <= 0 or hist.size == 0:
+        return {name: 0.0 for name, _ in THICKNESS_CLASSES}
+    thickness_cm = np.arange(hist.size) / scale * 100
+    bounds = np.array([upper for _, upper in THICKNESS_CLASSES])
+    classes = np.minimum(np.searchsorted(bounds, thickness_cm, side="right"), len(bounds) - 1)
+    lengths = np.bincount(classes, weights=hist, minlength=len(bounds)) / scale
+    return {name: float(lengths[i]) for i, (name, _) in enumerate(THICKNESS_CLASSES)}
+
+
+def estimate_materials_by_thickness(thickness_hist: Sequence[int], scale: float, wall_height: float = 2.5,
+                                    waste_factor: float = 0.05, cement_ratio: float = 0.3) -> Dict[str, Dict]:
+    """הערכת חומרים לכל סוג בלוק לפי עובי הקירות שזוהו (קריאה וקטורית אחת)"""
+    lengths = thickness_buckets(thickness_hist, scale)
+    names = list(lengths)
+    results = estimate_materials_batch(
+        np.array([lengths[n] for n in names]), wall_height,
+        np.array([BLOCK_TYPES[n]["blocks_per_sqm"] for n in names]), waste_factor,
+        np.array([BLOCK_TYPES[n]["mortar_m3_per_sqm"] for n in names]), cement_ratio,
+    )
+    return {
+        name: {"length_m": lengths[name], **{col: results[col][i].item() for col in RESULT_COLUMNS}}
+        for i, name in enumerate(names)
+    }
+
+
+def aggregate_by_type(by_type: Dict[str, Dict]) -> Optional[Dict[str, float]]:
+    """
+    סיכום הפירוט לפי עובי - הסכום הכולל של כתב הכמויות, כך שהשורות מסתכמות אליו
+    מחזירה: None אם אין בפירוט אורך קירות
+    """
+    if not by_type or sum(est.get("length_m", 0) for est in by_type.values()) <= 0:
+        return None
+    total = {col: sum(est.get(col, 0) for est in by_type.values()) for col in RESULT_COLUMNS}
+    total["block_count"] = int(total["block_count"])
+    return total
+
+
+def scenario_grid(**axes: Iterable) -> List[Dict]:
+    """
+    מכפלה קרטזית של צירי תרחיש, לדוגמה:
+    scenario_grid(wall_height=[2.5, 3.0], block_type=["block_20", "block_10"], waste_factor=[0.03, 0.05])
+    צירים שלא הועברו מקבלים את ערך ברירת המחדל
+    """
+    unknown = set(axes) - set(DEFAULT_SCENARIO)
+    if unknown:
+        raise ValueError(f"צירי תרחיש לא מוכרים: {sorted(unknown)}")
+    names = list(DEFAULT_SCENARIO)
+    values = [list(axes.get(n, [DEFAULT_SCENARIO[n]])) for n in names]
+    return [dict(zip(names, combo)) for combo in product(*values)]
+
+
+def _scenario_arrays(scenarios: Sequence[Dict]) -> Dict[str, np.ndarray]:
+    full = [{**DEFAULT_SCENARIO, **s} for s in scenarios]
+    for s in full:
+        if s["block_type"] not in BLOCK_TYPES:
+            raise ValueError(f"סוג בלוק לא מוכר: {s['block_type']}")
+    return {
+        "wall_heights": np.array([s["wall_height"] for s in full], dtype=np.float64),
+        "blocks_per_sqm": np.array([BLOCK_TYPES[s["block_type"]]["blocks_per_sqm"] for s in full]),
+        "mortar_m3_per_sqm": np.array([BLOCK_TYPES[s["block_type"]]["mortar_m3_per_sqm"] for s in full]),
+        "waste_factors": np.array([s["waste_factor"] for s in full], dtype=np.float64),
+        "cement_ratios": np.array([s["cement_ratio"] for s in full], dtype=np.float64),
+    }
+
+
+def run_scenarios(wall_lengths: ArrayLike, scenarios: Sequence[Dict], plan_labels: Optional[Sequence] = None):
+    """
+    מריץ את כל התרחישים על כל התוכניות בקריאה וקטורית אחת
+    מחזירה: DataFrame עם שורה לכל (תוכנית, תרחיש) - עמודות הפרמטרים ועמודות התוצאה
+    """
+    import pandas as pd
+
+    lengths = np.atleast_1d(np.asarray(wall_lengths, dtype=np.float64))
+    params = _scenario_arrays(scenarios)
+    results = estimate_materials_batch(lengths[:, None], **{k: v[None, :] for k, v in params.items()})
+
+    n_plans, n_scenarios = len(lengths), len(scenarios)
+    labels = np.asarray(plan_labels if plan_labels is not None else np.arange(n_plans))
+    full = [{**DEFAULT_SCENARIO, **s} for s in scenarios]
+    table = {
+        "plan": np.repeat(labels, n_scenarios),
+        "scenario": np.tile(np.arange(n_scenarios), n_plans),
+        "wall_length_m": np.repeat(lengths, n_scenarios),
+    }
+    for name in DEFAULT_SCENARIO:
+        table[name] = np.tile(np.array([s[name] for s in full]), n_plans)
+    for col in RESULT_COLUMNS:
+        table[col] = results[col].ravel()
+    return pd.DataFrame(table)
+
+
+def run_portfolio_scenarios(scenarios: Sequence[Dict]):
+    """ניתוח רגישות על כל התוכניות המכוילות במסד"""
+    from database import get_plan_wall_lengths
+
+    plans = get_plan_wall_lengths()
+    return run_scenarios([p["wall_length_m"] for p in plans], scenarios, [p["id"] for p in plans])
@@ -0,0 +1,92 @@
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from database import get_fingerprint_version, get_plan_fingerprints
+
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    עץ BK מעל מרחק Hamming: חיפוש כל הפריטים בתוך רדיוס נתון
+    בלי לעבור על כל הספרייה - בכל צומת נבדקים רק ילדים שבטווח [d - r, d + r]
+    """
+
+    def __init__(self):
+        self.root = None  # [key, items, children: {distance: node}]
+        self.size = 0
+        self.comparisons = 0  # מספר חישובי המרחק בחיפוש האחרון
+
+    def add(self, key: int, item: Any) -> None:
+        self.size += 1
+        if self.root is None:
+            self.root = [key, [item], {}]
+            return
+        node = self.root
+        while True:
+            d = _hamming(key, node[0])
+            if d == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [key, [item], {}]
+                return
+            node = child
+
+    def search(self, key: int, radius: int) -> List[Tuple[int, Any]]:
+        """מחזירה: [(מרחק, פריט)] ממוין מהקרוב לרחוק"""
+        self.comparisons = 0
+        if self.root is None:
+            return []
+        found = []
+        stack = [self.root]
+        while stack:
+            node_key, items, children = stack.pop()
+            d = _hamming(key, node_key)
+            self.comparisons += 1
+            if d <= radius:
+                found.extend((d, item) for item in items)
+            for child_d, child in children.items():
+                if d - radius <= child_d <= d + radius:
+                    stack.append(child)
+        found.sort(key=lambda x: x[0])
+        return found
+
+    def __len__(self):
+        return self.size
+
+
+_lock = threading.Lock()
+_cached: Dict[str, Any] = {"version": None, "tree": None}
+
+
+def plan_index() -> BKTree:
+    """
+    אינדקס טביעות הפריסה של התוכניות המכוילות - נבנה מחדש רק כשהטביעות עצמן השתנו
+    (מונה ייעודי; העלאת תוכנית לא מכוילת או דיווח התקדמות לא פוסלים אותו)
+    """
+    version = get_fingerprint_version()
+    with _lock:
+        if _cached["version"] != version:
+            tree = BKTree()
+            for plan in get_plan_fingerprints():
+                tree.add(int(plan["fingerprint"], 16), plan)
+            _cached.update(version=version, tree=tree)
+        return _cached["tree"]
+
+
+def find_visually_similar(fingerprint: str, max_distance: int, exclude_filename: Optional[str] = None,
+                          aspect: Optional[float] = None, max_aspect_diff: float = 0.05) -> List[Dict]:
+    """
+    תוכניות מכוילות עם פריסת קירות דומה (מרחק Hamming בין טביעות)
+    aspect: יחס רוחב/גובה של תחום הקירות - אם ניתן, רק תוכניות שהיחס שלהן קרוב (|log| עד max_aspect_diff)
+    מחזירה: [{"plan", "distance"}] מהקרוב לרחוק
+    """
+    matches = plan_index().search(int(fingerprint, 16), max_distance)
+    return [{"plan": plan, "distance": d} for d, plan in matches
+            if plan["filename"] != exclude_filename
+            and (aspect is None or abs(math.log(aspect / plan["content_aspect"])) <= max_aspect_diff)]
@@ -0,0 +1,166 @@
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import database
+
+# כתיבה מקובצת: עד BATCH_MAX פעולות או BATCH_WAIT_MS מהפעולה הראשונה - טרנזקציה אחת
+BATCH_MAX = 64
+BATCH_WAIT_MS = 5
+
+Op = Callable[[sqlite3.Connection], Any]
+
+_queue: "queue.Queue[Tuple[Op, Future]]" = queue.Queue()
+_writer: Optional[threading.Thread] = None
+_start_lock = threading.Lock()
+logger = logging.getLogger("contech.ingest")
+
+
+def _connect() -> sqlite3.Connection:
+    # autocommit - הטרנזקציות מנוהלות ידנית (BEGIN IMMEDIATE + SAVEPOINT לכל פעולה)
+    conn = sqlite3.connect(database.DB_NAME, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _next_batch() -> List[Tuple[Op, Future]]:
+    batch = [_queue.get()]
+    deadline = time.monotonic() + BATCH_WAIT_MS / 1000
+    while len(batch) < BATCH_MAX:
+        remaining = deadline - time.monotonic()
+        try:
+            batch.append(_queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _write_batch(conn: sqlite3.Connection, batch: List[Tuple[Op, Future]]) -> None:
+    """
+    כל הקבוצה בטרנזקציה אחת; כל פעולה ב-SAVEPOINT משלה
+    כך שפעולה שנכשלה לא מפילה את שאר הדיווחים בקבוצה
+    פעולה שה-Future שלה בוטל לפני הכתיבה מדולגת; מכאן והלאה אי אפשר לבטל אותה
+    """
+    batch = [(op, future) for op, future in batch if future.set_running_or_notify_cancel()]
+    if not batch:
+        return
+    results: List[Tuple[Future, bool, Any]] = []
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for op, future in batch:
+            conn.execute("SAVEPOINT op")
+            try:
+                value = op(conn)
+                conn.execute("RELEASE op")
+                results.append((future, True, value))
+            except Exception as e:
+                conn.execute("ROLLBACK TO op")
+                conn.execute("RELEASE op")
+                results.append((future, False, e))
+        conn.execute("COMMIT")
+    except Exception as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        for _, future in batch:
+            future.set_exception(e)
+        return
+    # התוצאות נמסרות רק אחרי ה-COMMIT - מי שממתין יראה את הכתיבה שלו בקריאה הבאה
+    for future, ok, value in results:
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+
+def _run() -> None:
+    conn = _connect()
+    while True:
+        batch = _next_batch()
+        # הכותב לא מת בגלל קבוצה אחת, ו-task_done תמיד נקרא - אחרת flush ב-atexit נתקע
+        try:
+            _write_batch(conn, batch)
+        except Exception:
+            logger.exception("ingest batch of %d ops failed", len(batch))
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def _ensure_writer() -> None:
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        with _start_lock:
+            if _writer is None or not _writer.is_alive():
+                _writer = threading.Thread(target=_run, name="contech-writer", daemon=True)
+                _writer.start()
+
+
+def submit(op: Op) -> Future:
+    """מכניס פעולת כתיבה לתור של הכותב היחיד; ה-Future מתממש אחרי ה-COMMIT"""
+    _ensure_writer()
+    future: Future = Future()
+    _queue.put((op, future))
+    return future
+
+
+def flush() -> None:
+    """ממתין עד שכל מה שנכנס לתור עד עכשיו נכתב"""
+    if _writer is not None and _writer.is_alive():
+        _queue.join()
+
+
+atexit.register(flush)
+
+
+def _resolve_plan(conn: sqlite3.Connection, plan_id: Optional[int], plan: Optional[Dict]) -> int:
+    if plan_id is not None:
+        return plan_id
+    # תוכנית חדשה נוצרת רק אם עוד לא קיימת - מזהה קיים לעולם לא משתנה
+    conn.execute('''INSERT INTO plans (filename, plan_name, extracted_scale, confirmed_scale, raw_pixel_count, metadata_json)
+        VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(filename) DO NOTHING''',
+        (plan["filename"], plan.get("plan_name") or plan["filename"], plan.get("extracted_scale") or "",
+         plan.get("confirmed_scale") or 0, plan.get("raw_pixel_count") or 0, plan.get("metadata_json") or "{}"))
+    return conn.execute("SELECT id FROM plans WHERE filename = ?", (plan["filename"],)).fetchone()[0]
+
+
+def submit_progress_report(meters: float, note: str = "", plan_id: Optional[int] = None,
+                           plan: Optional[Dict] = None, worker_name: Optional[str] = None,
+                           coverage: Optional[Tuple[Any, List]] = None) -> Future:
+    """
+    דיווח התקדמות דרך התור
+    plan_id - תוכנית קיימת; או plan={"filename", ...} - נוצרת אם חסרה, באותה טרנזקציה
+    coverage - (skeleton, lines): הקווים מאוחדים למפת הכיסוי באותה טרנזקציה של הדיווח
+    ה-Future מחזיר: (plan_id, report_id, פיקסלי שלד חדשים במפה)
+    """
+    if plan_id is None and not (plan and plan.get("filename")):
+        raise ValueError("נדרש plan_id או plan עם filename")
+
+    def op(conn):
+        pid = _resolve_plan(conn, plan_id, plan)
+        on_coverage = 1 if coverage and coverage[1] else 0
+        cur = conn.execute("""INSERT INTO progress_reports (plan_id, meters_built, worker_name, note, on_coverage)
+            VALUES (?, ?, ?, ?, ?)""", (pid, meters, worker_name, note, on_coverage))
+        report_id, new_pixels = cur.lastrowid, 0
+        if on_coverage:
+            from coverage import merge_report_coverage
+            new_pixels = merge_report_coverage(conn, pid, *coverage)
+            # אם המפה אופסה (גודל שלד אחר) - הדיווח הזה כבר עליה
+            conn.execute("UPDATE progress_reports SET on_coverage = 1 WHERE id = ?", (report_id,))
+        return pid, report_id, new_pixels
+
+    return submit(op)
+
+
+def record_progress_report(meters: float, note: str = "", plan_id: Optional[int] = None,
+                           plan: Optional[Dict] = None, worker_name: Optional[str] = None,
+                           coverage: Optional[Tuple[Any, List]] = None,
+                           timeout: float = 30) -> Tuple[int, int, int]:
+    """כמו submit_progress_report אבל ממתין ל-COMMIT (read-your-writes)"""
+    return submit_progress_report(meters, note, plan_id, plan, worker_name, coverage).result(timeout)
@@ -1,31 +1,38 @@
 from analyzer import FloorPlanAnalyzer
+from boq_export import boq_items, write_csv
+from database import calculate_material_estimates
+
+# כיול ברירת מחדל
+PIXELS_PER_METER = 50.0
 
 
 def main():
     """Main script to run the floor plan analyzer."""
-    
-    # Initialize analyzer with default calibration
-    analyzer = FloorPlanAnalyzer(pixels_per_meter=50.0)
-    
+
+    analyzer = FloorPlanAnalyzer()
+
     # Hardcoded input file
     input_file = "plan.pdf"
-    
+
     try:
         # Analyze the floor plan
         print(f"Analyzing floor plan: {input_file}")
-        wall_length, processed_image = analyzer.analyze(input_file)
-        
+        total_pixels, _, _, _, metadata = analyzer.process_file(input_file)
+        wall_length = total_pixels / PIXELS_PER_METER
+
         print(f"\nAnalysis Results:")
         print(f"Total wall length: {wall_length:.2f} meters")
-        
+
         # Export BoQ to CSV
         print(f"\nExporting Bill of Quantities to boq.csv...")
-        boq_df = analyzer.export_boq(wall_length)
-        
+        rows = boq_items(None, metadata.get("plan_name"), wall_length, calculate_material_estimates(wall_length))
+        write_csv(rows, "boq.csv")
+
         print(f"\nBoQ Contents:")
-        print(boq_df.to_string(index=False))
+        for row in rows:
+            print(f"{row['item']:<20} {row['quantity']:>12.2f} {row['unit']}")
         print(f"\nBoQ exported successfully to boq.csv")
-        
+
     except FileNotFoundError:
         print(f"Error: File '{input_file}' not found. Please ensure the file exists in the current directory.")
     except Exception as e:
@@ -36,4 +43,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,117 @@
+import importlib.util
+import os
+from typing import Dict, Optional, Tuple
+
+import cv2
+import fitz  # PyMuPDF
+import numpy as np
+
+import analysis_cache
+
+# OCR מקומי (Tesseract) - אופציונלי; בלעדיו תוכניות סרוקות נשארות בלי טקסט כמו קודם
+OCR_AVAILABLE = importlib.util.find_spec("pytesseract") is not None
+OCR_LANG = os.environ.get("CONTECH_OCR_LANG", "heb+eng")
+# רזולוציה לאיתור טבלת הכותרת ולזיהוי התווים
+DETECT_DPI = 36
+OCR_DPI = 300
+OCR_MAX_PIXELS = 8_000_000
+# שינוי באלגוריתם מבטל את המטמון
+OCR_CACHE_VERSION = 1
+
+
+def _touches(a, b, margin: float) -> bool:
+    return a[0] - margin <= b[2] and b[0] - margin <= a[2] and a[1] - margin <= b[3] and b[1] - margin <= a[3]
+
+
+def find_title_block(gray: np.ndarray) -> Tuple[float, float, float, float]:
+    """
+    איתור טבלת הכותרת בתמונה ברזולוציה נמוכה: התא המלבני הקרוב לפינה הימנית-תחתונה,
+    ואליו מצטרפים התאים הסמוכים לו (הטבלה חולקת קווים עם המסגרת, אז מחפשים תאים ולא את המתאר החיצוני)
+    מחזירה: (x0, y0, x1, y1) כחלק מגודל הדף (0-1); אם לא נמצא - הפינה הימנית-תחתונה
+    """
+    h, w = gray.shape
+    page_area = w * h
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(binary, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+    cells = []
+    for contour in contours:
+        x, y, cw, ch = cv2.boundingRect(contour)
+        area = cw * ch
+        # תא סגור ומלבני, לא אות ולא כל שטח השרטוט
+        if 0.0005 * page_area <= area <= 0.25 * page_area and cv2.contourArea(contour) >= 0.85 * area:
+            cells.append((x, y, x + cw, y + ch))
+    corner = [c for c in cells if c[2] >= 0.85 * w and c[3] >= 0.85 * h]
+    if not corner:
+        return 0.6, 0.7, 1.0, 1.0
+    block = list(max(corner, key=lambda c: c[2] + c[3]))
+    margin = 0.01 * max(w, h)
+    grown = True
+    while grown:
+        grown = False
+        for c in cells:
+            if c[0] >= block[0] and c[1] >= block[1] and c[2] <= block[2] and c[3] <= block[3]:
+                continue
+            if not _touches(block, c, margin):
+                continue
+            union = [min(block[0], c[0]), min(block[1], c[1]), max(block[2], c[2]), max(block[3], c[3])]
+            if (union[2] - union[0]) * (union[3] - union[1]) <= 0.25 * page_area:
+                block, grown = union, True
+    x0, y0, x1, y1 = block
+    return x0 / w, y0 / h, x1 / w, y1 / h
+
+
+def _render_gray(page, dpi: float, clip=None) -> np.ndarray:
+    pix = page.get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72), clip=clip, colorspace=fitz.csGRAY)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+
+def _tesseract_lang(pytesseract) -> str:
+    """השפות המבוקשות שמותקנות בפועל (heb לא תמיד מותקן)"""
+    try:
+        installed = set(pytesseract.get_languages(config=""))
+    except Exception:
+        return OCR_LANG
+    langs = [lang for lang in OCR_LANG.split("+") if lang in installed]
+    return "+".join(langs) or "eng"
+
+
+def ocr_title_block(pdf_path: str) -> Dict[str, Optional[object]]:
+    """
+    OCR של אזור טבלת הכותרת בלבד בעמוד הראשון - לא של כל הגיליון
+    התוצאה נשמרת במטמון לפי חתימת תוכן הקובץ
+    מחזירה: {"text", "region", "lang"}; text ריק אם אין מנוע OCR מקומי
+    """
+    if not OCR_AVAILABLE:
+        return {"text": "", "region": None, "lang": None}
+    key = analysis_cache.cache_key("ocr", analysis_cache.file_hash(pdf_path), OCR_LANG, OCR_DPI, OCR_CACHE_VERSION)
+    cached = analysis_cache.load_json(key)
+    if cached is not None:
+        return cached
+
+    import pytesseract
+
+    doc = fitz.open(pdf_path)
+    try:
+        page = doc[0]
+        region = find_title_block(_render_gray(page, DETECT_DPI))
+        rect = page.rect
+        clip = fitz.Rect(rect.x0 + region[0] * rect.width, rect.y0 + region[1] * rect.height,
+                         rect.x0 + region[2] * rect.width, rect.y0 + region[3] * rect.height)
+        # רזולוציה מלאה רק לאזור הכותרת, עם תקרה לטבלאות גדולות במיוחד
+        dpi = OCR_DPI
+        pixels = clip.width * clip.height * (dpi / 72) ** 2
+        if pixels > OCR_MAX_PIXELS:
+            dpi *= (OCR_MAX_PIXELS / pixels) ** 0.5
+        crop = _render_gray(page, dpi, clip)
+    finally:
+        doc.close()
+
+    lang = _tesseract_lang(pytesseract)
+    try:
+        text = pytesseract.image_to_string(crop, lang=lang, config="--psm 6")
+    except Exception:
+        # pytesseract מותקן אבל בלי Tesseract עצמו - לא שומרים במטמון, אולי יותקן בהמשך
+        return {"text": "", "region": list(region), "lang": None}
+    result = {"text": text.strip(), "region": list(region), "lang": lang}
+    analysis_cache.save_json(key, result)
+    return result
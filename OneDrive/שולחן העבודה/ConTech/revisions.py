@@ -0,0 +1,168 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import analysis_cache
+from analyzer import TILE_SIZE
+from database import (
+    save_plan_revision, get_revision_candidates, get_plan_by_filename
+)
+
+# טביעת פריסה: pHash של 256 ביט (16x16 מקדמי DCT נמוכים) של מסכת הקירות, חתוכה לתחום הקירות
+FINGERPRINT_SIZE = 64
+FINGERPRINT_DCT = 16
+FINGERPRINT_BITS = FINGERPRINT_DCT * FINGERPRINT_DCT
+# גיליון זהה חזותית (הצעת סקלה): מדידה על פריסות אקראיות - אותו גיליון בפרופיל אחר, בהזזה על הדף
+# או עם קיר שזז עד 48 ביט; גיליונות שונים 86 ומעלה (חציון 118)
+LAYOUT_MATCH_MAX_DISTANCE = 64
+# הפרש מקסימלי ביחס רוחב/גובה של תחום הקירות (log של היחס, בערך 5%) - הטביעה עצמה לא רואה אותו
+LAYOUT_MAX_ASPECT_DIFF = 0.05
+# גרסה קודמת: חלק האריחים הזהים מתוך האריחים שיש בהם קירות (Jaccard) - השוואה מדויקת, לא טביעה מקורבת.
+# עם אותו שם מנורמל מספיק פחות (גרסה עם שינויים רבים); בלי - נדרש רוב האריחים
+REVISION_MIN_SHARED_TILES = 0.5
+REVISION_NAME_MIN_SHARED_TILES = 0.2
+
+_REVISION_SUFFIX = re.compile(
+    r"(?:[\s_\-\.]+(?:rev(?:ision)?|גרסה|מהדורה)[\s_\-\.]*[0-9a-zא-ת]{1,3}|[\s_\-\.]+r\d{1,2})$",
+    re.IGNORECASE
+)
+
+
+def normalize_plan_name(name: Optional[str]) -> str:
+    """
+    מנרמל שם תוכנית להשוואה בין גרסאות
+    לדוגמה: "A-101 Rev C.pdf" -> "a 101"
+    """
+    if not name:
+        return ""
+    key = re.sub(r"\.pdf$", "", name.strip(), flags=re.IGNORECASE)
+    key = _REVISION_SUFFIX.sub("", key)
+    key = re.sub(r"[\s_\-\.]+", " ", key)
+    return key.strip().lower()
+
+
+def layout_fingerprint(mask: np.ndarray) -> Tuple[Optional[str], Optional[float]]:
+    """
+    טביעת אצבע של פריסת הקירות: pHash של 256 ביט אחרי חיתוך לתחום הקירות
+    (כך שהמיקום על הדף והשוליים לא משפיעים), ויחס הרוחב/גובה של התחום - שהחיתוך מעלים מהטביעה
+    מחזירה: (hex, יחס) או (None, None) אם אין קירות
+    """
+    points = cv2.findNonZero(mask)
+    if points is None:
+        return None, None
+    x, y, w, h = cv2.boundingRect(points)
+    small = cv2.resize(mask[y:y + h, x:x + w], (FINGERPRINT_SIZE, FINGERPRINT_SIZE),
+                       interpolation=cv2.INTER_AREA).astype(np.float32)
+    coeffs = cv2.dct(small)[:FINGERPRINT_DCT, :FINGERPRINT_DCT]
+    return np.packbits(coeffs > np.median(coeffs)).tobytes().hex(), w / h
+
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def find_predecessor(name_key: str, tile_hashes: List[str], shape: Tuple[int, ...],
+                     tile_size: int = TILE_SIZE) -> Optional[Dict]:
+    """
+    מחפש את הגרסה הקודמת של אותו גיליון - לפי חלק האריחים הזהים (חתימות האריחים שיש בהם קירות);
+    גיליון אחר עם אותו שם או גודל לא נחשב גרסה קודמת אם התוכן שלו שונה
+    מחזירה: רשומת plan_revisions (עם shared_share) או None
+    """
+    best, best_rank = None, None
+    for rev in get_revision_candidates(shape[0], shape[1], tile_size, tile_hashes):
+        share = rev["shared_tiles"] / (len(tile_hashes) + rev["content_tiles"] - rev["shared_tiles"])
+        same_name = bool(name_key) and rev["name_key"] == name_key
+        if share < (REVISION_NAME_MIN_SHARED_TILES if same_name else REVISION_MIN_SHARED_TILES):
+            continue
+        # אותו שם קודם; אחר כך הכי הרבה אריחים זהים (המועמדים ממוינים מהחדש לישן בתיקו)
+        if best_rank is None or (same_name, share) > best_rank:
+            best, best_rank = dict(rev, shared_share=share), (same_name, share)
+    return best
+
+
+def _load_revision_tiles(rev: Dict) -> Optional[Dict]:
+    data = analysis_cache.load_arrays(rev["cache_key"])
+    if data is None:
+        return None
+    return {
+        "skeleton": analysis_cache.unpack_mask(data["skeleton"], data["shape"]),
+        "thickness": data.get("thickness"),
+        "tile_hashes": [str(h) for h in data["tile_hashes"]],
+        "tile_counts": data["tile_counts"],
+        "tile_thickness_hist": data.get("tile_thickness_hist"),
+        "tile_size": int(data["tile_size"]),
+    }
+
+
+def analyze_revision(analyzer, pdf_path: str, filename: str):
+    """
+    ניתוח תוכנית עם מודעות לגרסאות: אם נמצאה גרסה קודמת של הגיליון,
+    רק אריחים שהשתנו עוברים שלד מחדש והשאר נלקחים מהגרסה הקודמת.
+    מחזירה: (pixels, skeleton, thick_walls, image, metadata, revision_report)
+    """
+    image_proc = analyzer.load_plan_image(pdf_path)
+    thick_walls = analyzer.preprocess_image(image_proc)
+    metadata = analyzer.extract_metadata(pdf_path)
+    metadata["analysis_profile"] = analyzer.profile_info()
+
+    name_key = normalize_plan_name(metadata.get("plan_name")) or normalize_plan_name(filename)
+    fingerprint, content_aspect = layout_fingerprint(thick_walls)
+    grid = list(analyzer.iter_tiles(thick_walls.shape, TILE_SIZE))
+    hashes = [analyzer.tile_hash(thick_walls, tile) for tile in grid]
+    content_hashes = [h for h, tile in zip(hashes, grid) if analyzer.tile_has_content(thick_walls, tile)]
+    parent = find_predecessor(name_key, content_hashes, thick_walls.shape, TILE_SIZE)
+    previous = _load_revision_tiles(parent) if parent else None
+
+    skeleton, tiles = analyzer.skeletonize_tiles(thick_walls, previous, TILE_SIZE, hashes)
+    total_pixels = int(tiles["tile_counts"].sum())
+
+    key = analysis_cache.cache_key("revision", analysis_cache.file_hash(pdf_path), tiles["tile_size"],
+                                    analyzer.profile_key)
+    analysis_cache.save_arrays(
+        key,
+        skeleton=analysis_cache.pack_mask(skeleton),
+        shape=np.array(skeleton.shape),
+        tile_hashes=np.array(tiles["tile_hashes"]),
+        tile_counts=tiles["tile_counts"],
+        thickness=tiles["thickness"],
+        tile_thickness_hist=tiles["tile_thickness_hist"],
+        tile_size=np.array(tiles["tile_size"]),
+    )
+    total_tiles = len(tiles["tile_hashes"])
+    revision_id = save_plan_revision(
+        filename, metadata.get("plan_name"), name_key, fingerprint,
+        thick_walls.shape[0], thick_walls.shape[1], tiles["tile_size"],
+        total_pixels, key, parent["id"] if parent else None,
+        len(tiles["changed_tiles"]), total_tiles, content_hashes, content_aspect
+    )
+
+    report = {
+        "revision_id": revision_id,
+        "parent_id": parent["id"] if parent else None,
+        "parent_filename": parent["filename"] if parent else None,
+        "parent_shared_tiles": round(parent["shared_share"], 3) if parent else None,
+        "total_tiles": total_tiles,
+        "changed_tiles": tiles["changed_tiles"],
+        "reused_tiles": total_tiles - len(tiles["changed_tiles"]),
+        "pixel_delta": None,
+        "length_delta_m": None,
+        "tile_deltas": {},
+        "thickness_hist": tiles["thickness_hist"].tolist(),
+        "fingerprint": fingerprint,
+        "content_aspect": content_aspect,
+    }
+    if parent:
+        # השינוי הכולל נלקח מהמסד - לא תלוי בקובץ המטמון של הגרסה הקודמת (שאולי נמחק)
+        report["pixel_delta"] = total_pixels - int(parent["raw_pixel_count"] or 0)
+        parent_plan = get_plan_by_filename(parent["filename"])
+        if parent_plan and parent_plan.get("confirmed_scale"):
+            report["length_delta_m"] = report["pixel_delta"] / float(parent_plan["confirmed_scale"])
+    if previous is not None:
+        report["tile_deltas"] = {
+            idx: int(tiles["tile_counts"][idx]) - int(previous["tile_counts"][idx])
+            for idx in tiles["changed_tiles"] if idx < len(previous["tile_counts"])
+        }
+
+    return total_pixels, skeleton, thick_walls, image_proc, metadata, report
@@ -0,0 +1,92 @@
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+STROKE_WIDTH = 5
+WALL_DILATE_KERNEL = 15
+WALL_DILATE_ITERATIONS = 2
+
+
+def wall_kernel_size(thickness_hist: Optional[List[int]]) -> int:
+    """גודל גרעין ההרחבה לפי העובי החציוני של הקירות בתוכנית (במקום ערך קבוע)"""
+    if not thickness_hist or sum(thickness_hist) == 0:
+        return WALL_DILATE_KERNEL
+    cumulative = np.cumsum(thickness_hist)
+    median = int(np.searchsorted(cumulative, cumulative[-1] / 2))
+    return int(np.clip(median | 1, 5, 31))
+
+
+def dilated_wall_mask(thick_walls: np.ndarray, size: Tuple[int, int], kernel_size: int = WALL_DILATE_KERNEL) -> np.ndarray:
+    """מסכת קירות מורחבת בגודל התמונה המקורית (w, h) - להדגשה ולמדידה"""
+    w, h = size
+    if thick_walls.shape[:2] != (h, w):
+        thick_walls = cv2.resize(thick_walls, (w, h), interpolation=cv2.INTER_NEAREST)
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    return cv2.dilate((thick_walls > 0).astype(np.uint8) * 255, kernel, iterations=WALL_DILATE_ITERATIONS)
+
+
+def _line_points(obj: Dict) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    if "left" not in obj or "top" not in obj or "x1" not in obj:
+        return None
+    l, t = int(obj["left"]), int(obj["top"])
+    return (l + int(obj["x1"]), t + int(obj["y1"])), (l + int(obj["x2"]), t + int(obj["y2"]))
+
+
+def _signature(obj: Dict) -> Tuple:
+    return tuple(obj.get(k) for k in ("type", "left", "top", "x1", "y1", "x2", "y2"))
+
+
+class StrokeMeasurer:
+    """
+    מדידה מצטברת של קווים שסומנו על הקנבס:
+    שומר את מסכת הקווים בין ריצות ומעבד רק אובייקטים שנוספו מאז הריצה הקודמת.
+    עלות כל קו חדש - ביחס לגודל הקו, לא לגודל הגיליון.
+    """
+
+    def __init__(self, walls_canvas: np.ndarray, stroke_width: int = STROKE_WIDTH):
+        self.walls = walls_canvas
+        self.stroke_width = stroke_width
+        self.reset()
+
+    def reset(self):
+        self.mask = np.zeros(self.walls.shape[:2], dtype=np.uint8)
+        self.processed = 0
+        self.last_signature = None
+        self.intersection_pixels = 0
+        self.lines: List[Tuple[Tuple[int, int], Tuple[int, int]]] = []
+
+    def _draw(self, p1, p2):
+        h, w = self.mask.shape
+        pad = self.stroke_width
+        x0, x1 = max(0, min(p1[0], p2[0]) - pad), min(w, max(p1[0], p2[0]) + pad + 1)
+        y0, y1 = max(0, min(p1[1], p2[1]) - pad), min(h, max(p1[1], p2[1]) + pad + 1)
+        if x0 >= x1 or y0 >= y1:
+            return  # הקו כולו מחוץ לקנבס
+        roi_walls = self.walls[y0:y1, x0:x1]
+        before = cv2.countNonZero(cv2.bitwise_and(self.mask[y0:y1, x0:x1], roi_walls))
+        cv2.line(self.mask, p1, p2, 255, self.stroke_width)
+        after = cv2.countNonZero(cv2.bitwise_and(self.mask[y0:y1, x0:x1], roi_walls))
+        self.intersection_pixels += after - before
+
+    def update(self, objects: List[Dict]) -> int:
+        """
+        מעדכן לפי רשימת האובייקטים הנוכחית של הקנבס
+        אם אובייקטים נמחקו/הוחלפו (undo / ניקוי) - המדידה נבנית מחדש
+        מחזירה: מספר פיקסלי החיתוך עם הקירות (בקואורדינטות הקנבס)
+        """
+        if len(objects) < self.processed or (
+                self.processed and _signature(objects[self.processed - 1]) != self.last_signature):
+            self.reset()
+        for obj in objects[self.processed:]:
+            points = _line_points(obj)
+            if points:
+                self._draw(*points)
+                self.lines.append(points)
+        if objects:
+            self.processed = len(objects)
+            self.last_signature = _signature(objects[-1])
+        return self.intersection_pixels
+
+    def meters(self, factor: float, scale: float) -> float:
+        return (self.intersection_pixels / factor) / scale if scale > 0 else 0